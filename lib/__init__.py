@@ -5,10 +5,11 @@ import sys
 
 from .scandb import ScanDB, InstrumentDB
 from .detectors import (get_detector, Trigger, Counter, MotorCounter,
-                        ROISumCounter, SimpleDetector, ScalerDetector,
+                        ROISumCounter, CounterGroup, SimpleDetector, ScalerDetector,
                         McaDetector, MultiMcaDetector, AreaDetector)
 from .positioner import Positioner
-from .datafile import ASCIIScanFile
+from .datafile import (ASCIIScanFile, HDF5ScanFile, StepScanData,
+                       ScanDataCache, read_scanfiles)
 from .scan import StepScan
 from .xafs_scan import XAFS_Scan, etok, ktoe
 from .scandb_schema import create_scandb
@@ -21,7 +21,8 @@ def create_scan(filename='scan.dat', comments=None, type='linear',
                 pos_settle_time=0.01, det_settle_time=0.01, scantime=None,
                 elem=None, edge=None, e0=None, dimension=1, regions=None,
                 energy_drive=None, energy_read=None, time_kw=0, max_time=0,
-                is_relative=False, scandb=None, larch=None, data_callback=None, **kws):
+                is_relative=False, scandb=None, larch=None, data_callback=None,
+                filetype='ASCII', adaptive_settle=False, **kws):
     """
     return a StepScan object, built from function arguments
 
@@ -35,7 +36,8 @@ def create_scan(filename='scan.dat', comments=None, type='linear',
     detmode (string):  detector mode, for configuring detector and counters,
                    one of 'scaler', 'roi', 'ndarray' [None: guess from scan type]
     dwelltime (float or array):  dwelltime per point
-    pos_settle_time (float):  positioner settling time
+    pos_settle_time (float):  positioner settling time, or maximum
+                    settling time with adaptive_settle
     det_settle_time (float):  detector settling time
     positioners (list or None):  list of list of Positioners values for step scan
     inner  (list or None):  Positioners values for inner loop of mesh / fastmap scan
@@ -51,6 +53,10 @@ def create_scan(filename='scan.dat', comments=None, type='linear',
     max_time (float): max dwelltime for XAFS scan
     is_relative (bool): use relative for XAFS scan (ONLY!)
     scandb (ScanDB instance or None): scandb instance
+    filetype (string): output file type, 'ASCII', 'ASCII_STREAM',
+                       or 'HDF5' ['ASCII']
+    adaptive_settle (bool): whether positioners settle when their
+                       readbacks converge [False]
 
     Notes
     ------
@@ -177,10 +183,12 @@ def create_scan(filename='scan.dat', comments=None, type='linear',
     scan.larch = larch
     scan.scantype = scantype
     scan.filename = filename
+    scan.filetype = filetype
     scan.scantime = scantime
     scan.nscans = nscans
     scan.pos_settle_time = pos_settle_time
     scan.det_settle_time = det_settle_time
+    scan.adaptive_settle = adaptive_settle
     if scan.dwelltime is None:
         scan.set_dwelltime(dwelltime)
     return scan
@@ -17,16 +17,33 @@ ScanFile supports several methods:
   write_timestamp()
   write_data()
 
-which  can be overridden to create a new Output file type
+which  can be overridden to create a new Output file type.
+
+HDF5ScanFile writes the same data to an HDF5 file with a NeXus-like
+layout, and requires h5py.
 """
 import os
+import sys
 import six
 import time
 import numpy as np
 import json
+import warnings
+from threading import Thread
+from multiprocessing import Pool
+from functools import partial
 from collections import OrderedDict
+from six.moves.queue import Queue, Empty
+
+from hashlib import sha1
+from .file_utils import (new_filename, get_timestamp, fix_filename, get_homedir,
+                         replace_file)
 
-from .file_utils import new_filename, get_timestamp, fix_filename
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    HAS_H5PY = False
 
 COM1 = '#'
 COM2 = '/'*3 + '  Users Comments  ' + '/'*3
@@ -37,9 +54,25 @@ FILETOP = '#XDI/1.1    Epics StepScan File'
 class StepScanData(object):
     """
     Holds data as read from a Scan Data File.
+
+    The header is parsed when the file is read, but the numerical data
+    is only parsed (in a single vectorized pass) when first needed, by
+    .data or get_data().  To read many files, use read_scanfiles().
+
+    With a ScanDataCache (or cache=True for the default cache), files
+    that have been read before are loaded from the cache, with .data
+    memory-mapped (and read-only).
+
+    Use streaming=True for a file that is still being written (as by
+    StreamingASCIIScanFile), so that a last line without a newline is
+    taken to be a partial line, and skipped.
     """
-    def __init__(self, filename=None, **kws):
+    def __init__(self, filename=None, cache=None, streaming=False, **kws):
         self.filename = filename
+        if cache is True:
+            cache = ScanDataCache()
+        self.cache = cache
+        self.streaming = streaming
         self.extra_pvs = []
         self.comments  = []
         self.column_keys    = []
@@ -48,14 +81,54 @@ class StepScanData(object):
         self.column_pvnames = []
         self.breakpoints    = []
         self.breakpoint_times = []
+        self.scan_params = {}
+        self.array_data = OrderedDict()
         self.__arraymap = None
         self.start_time = None
         self.stop_time = None
         self.data = []
+        self._datalines = None
         self._valid = False
         if filename is not None:
             self.read(filename)
 
+    @property
+    def data(self):
+        """2-D array of data, one row per column"""
+        if self._data is None:
+            self._data = self._parse_data(self._datalines)
+            self._datalines = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._datalines = None
+
+    def _parse_data(self, lines):
+        "parse data lines to array, one row per column"
+        if lines is None or len(lines) == 0:
+            return np.array([])
+        ncols = len(lines[0].split())
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                data = np.fromstring('\n'.join(lines), sep=' ')
+            except ValueError:
+                data = None
+        if data is not None and data.size == ncols*len(lines):
+            return data.reshape((len(lines), ncols)).transpose()
+        # slow path: parse line by line, skipping invalid lines
+        rows = []
+        for line in lines:
+            try:
+                row = [float(w) for w in line.split()]
+            except ValueError:
+                continue
+            if len(row) == ncols:
+                rows.append(row)
+        return np.array(rows).transpose()
+
     def get_data(self, key, fold_breakpoints=False):
         """get positioner or detector array either by key, name, or index
         key can be any of (case-insensitive):
@@ -85,11 +158,18 @@ class StepScanData(object):
         if filename is not None:
             self.filename = filename
         self._valid = False
-        fh = open(self.filename, 'r')
-
-
-        lines = fh.readlines()
-        line0 = lines.pop(0)
+        if HAS_H5PY and h5py.is_hdf5(self.filename):
+            return self.read_hdf5()
+        if self.cache is not None and self.cache.get(self):
+            return
+        with open(self.filename, 'r') as fh:
+            text = fh.read()
+        lines = text.split('\n')
+        # the last line is empty, or may be a partial line of a file
+        # being written
+        if lines[-1] == '' or self.streaming:
+            lines.pop()
+        line0 = lines.pop(0) if len(lines) > 0 else ''
         if not line0.startswith(FILETOP):
             print( '%s is not a valid Epics Scan file' % self.filename)
             return
@@ -101,49 +181,254 @@ class StepScanData(object):
             return w
         mode = None
         extras = {}
+        datalines = []
         modes = {'Time': 'comment', '----': 'data',
                  'Legend Start': 'legend', 'Legend End': 'legend_end',
-                 'ExtraPVs Start': 'extras', 'ExtraPVs End': 'extras_end'}
+                 'ExtraPVs Start': 'extras', 'ExtraPVs End': 'extras_end',
+                 'ScanParameters Start': 'params',
+                 'ScanParameters End': 'params_end',
+                 COM2.strip(): 'comment',
+                 'Scan start_time': 'start_time', 'Scan end_time': 'end_time'}
         for line in lines:
-            if line.startswith(COM1):
-                key, val = split_header(line[:-1])
-                if key.startswith('----'): key = '----'
-                if key in modes:
-                    mode = modes[key]
-                    if mode == 'comment':
+            if not line.startswith(COM1):
+                if len(line.strip()) > 0:
+                    datalines.append(line)
+                continue
+            line = line.rstrip('\r')
+            key, val = split_header(line)
+            if key.startswith('----'): key = '----'
+            mkey = key.replace('.', ' ')
+            if mkey in modes:
+                mode = modes[mkey]
+                if mode == 'comment':
+                    if key == 'Time':
                         self.stop_time  = val
                         if self.start_time is None:
                             self.start_time = val
-                    elif mode == 'extras':
-                        self.breakpoints.append(len(self.data))
-                        self.breakpoint_times.append(self.stop_time)
-                    elif mode == 'extras_end':
-                        self.extra_pvs.append(extras)
-                        extras = {}
-                    continue
-                if mode == 'comment':
-                    cmt = line[:-1].strip()
-                    if cmt.startswith('#'):  cmt = line[1:].strip()
-                    self.comments.append(cmt)
-                elif mode in ('legend', 'extras'):
-                    words = [w.strip() for w in val.split(SEP)]
-                    if len(words) == 1: words.append('')
-                    if mode == 'extras':
-                        extras[key] = (words[0], words[1])
                     else:
-                        if len(words) == 2: words.append('')
-                        self.column_keys.append(key)
-                        self.column_names.append(words[0])
-                        self.column_units.append(words[1])
-                        self.column_pvnames.append(words[2])
-
-            else: # data!
-                self.data.append([float(i) for i in line[:-1].split()])
+                        self.comments = []
+                elif mode == 'start_time':
+                    self.start_time = self.stop_time = val
+                elif mode == 'end_time':
+                    self.stop_time = val
+                elif mode == 'extras':
+                    self.breakpoints.append(len(datalines))
+                    self.breakpoint_times.append(self.stop_time)
+                elif mode == 'extras_end':
+                    self.extra_pvs.append(extras)
+                    extras = {}
+                continue
+            if mode == 'comment':
+                cmt = line.strip()
+                if cmt.startswith('#'):  cmt = line[1:].strip()
+                self.comments.append(cmt)
+            elif mode == 'params':
+                self.scan_params[key.replace('ScanParameters.', '')] = val
+            elif mode in ('legend', 'extras'):
+                words = [w.strip() for w in val.split(SEP)]
+                if len(words) == 1: words.append('')
+                if mode == 'extras':
+                    extras[key] = (words[0], words[1])
+                else:
+                    if len(words) == 2:
+                        # 'name units || pvname'
+                        name_units = words[0].split(None, 1)
+                        if len(name_units) == 1: name_units.append('')
+                        words = name_units + words[1:]
+                    self.column_keys.append(key)
+                    self.column_names.append(words[0])
+                    self.column_units.append(words[1])
+                    self.column_pvnames.append(words[2])
+
         #
         self.comments = '\n'.join(self.comments)
-        self.data = np.array(self.data).transpose()
+        self._data = None
+        self._datalines = datalines
+        self._valid = True
+        if self.cache is not None:
+            self.cache.put(self)
+
+    def read_hdf5(self):
+        "read HDF5 file as written by HDF5ScanFile"
+        fh = h5py.File(self.filename, 'r')
+        if H5_ENTRY not in fh or fh[H5_ENTRY].attrs.get('creator', '') != FILETOP:
+            print( '%s is not a valid Epics Scan file' % self.filename)
+            fh.close()
+            return
+        entry = fh[H5_ENTRY]
+        self.start_time = h5_str(entry.attrs.get('start_time', None))
+        self.stop_time = h5_str(entry.attrs.get('end_time', None))
+        self.comments = h5_str(entry.attrs.get('comments', ''))
+        self.breakpoints = [int(b) for b in entry.attrs.get('breakpoints', [])]
+        self.breakpoint_times = [h5_str(t) for t in
+                                 entry.attrs.get('breakpoint_times', [])]
+        extras = {}
+        for key, val in entry['extra_pvs'].attrs.items():
+            if key != 'NX_class':
+                extras[key] = tuple(h5_str(v) for v in val)
+        self.extra_pvs = [extras]
+        self.scan_params = dict((key, h5_str(val)) for key, val in
+                                entry['scan_params'].attrs.items()
+                                if key != 'NX_class')
+        columns, self.array_data = [], OrderedDict()
+        for name, dset in entry['data'].items():
+            if dset.ndim == 1:
+                columns.append((int(dset.attrs['column']), name, dset))
+            else:
+                self.array_data[name] = dset[()]
+        columns.sort()
+        data = []
+        for icol, name, dset in columns:
+            self.column_keys.append('Column.%i' % icol)
+            self.column_names.append(name)
+            self.column_units.append(h5_str(dset.attrs.get('units', '')))
+            self.column_pvnames.append(h5_str(dset.attrs.get('pvname', '')))
+            data.append(dset[()])
+        fh.close()
+        self.data = np.array(data)
         self._valid = True
 
+class ScanDataCache(object):
+    """Cache of data from scan files, for fast re-reading
+
+    For each scan file, the header is saved to a .json file, and the
+    data to a .npy file that is memory-mapped when read.  Entries are
+    keyed by the path of the scan file, and are valid only for the
+    modification time and size of the scan file when cached.
+
+    When the total size of the cache exceeds max_size bytes, the least
+    recently used entries are removed.
+
+    cache = ScanDataCache(cachedir=None, max_size=2**30)
+    sdata = StepScanData(filename, cache=cache)
+    cache.invalidate(filename)   # remove entry for one file
+    cache.invalidate()           # remove all entries
+    """
+    attrs = ('extra_pvs', 'comments', 'column_keys', 'column_names',
+             'column_units', 'column_pvnames', 'breakpoints',
+             'breakpoint_times', 'scan_params', 'start_time', 'stop_time')
+
+    def __init__(self, cachedir=None, max_size=2**30):
+        if cachedir is None:
+            cachedir = os.path.join(get_homedir(), '.epicsscan', 'datacache')
+        self.cachedir = cachedir
+        self.max_size = max_size
+
+    def _entry(self, filename):
+        "base path of cache entry for a scan file"
+        key = sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+        return os.path.join(self.cachedir, key)
+
+    def get(self, sdata):
+        """fill StepScanData from cache, returning whether a valid
+        cache entry was found"""
+        base = self._entry(sdata.filename)
+        try:
+            with open(base + '.json', 'r') as fh:
+                meta = json.load(fh)
+            stat = os.stat(sdata.filename)
+        except (IOError, OSError, ValueError):
+            return False
+        if meta.get('mtime') != stat.st_mtime or meta.get('size') != stat.st_size:
+            self.invalidate(sdata.filename)
+            return False
+        try:
+            data = np.load(base + '.npy', mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            self.invalidate(sdata.filename)
+            return False
+        for attr in self.attrs:
+            setattr(sdata, attr, meta[attr])
+        sdata.extra_pvs = [dict((k, tuple(v)) for k, v in extras.items())
+                           for extras in sdata.extra_pvs]
+        sdata.data = data
+        sdata._valid = True
+        os.utime(base + '.json', None)
+        return True
+
+    def put(self, sdata):
+        "save StepScanData to cache"
+        base = self._entry(sdata.filename)
+        try:
+            stat = os.stat(sdata.filename)
+            if not os.path.isdir(self.cachedir):
+                os.makedirs(self.cachedir)
+            meta = dict((attr, getattr(sdata, attr)) for attr in self.attrs)
+            meta['filename'] = os.path.abspath(sdata.filename)
+            meta['mtime'] = stat.st_mtime
+            meta['size'] = stat.st_size
+            with open(base + '.tmp.npy', 'wb') as fh:
+                np.save(fh, np.asarray(sdata.data))
+            replace_file(base + '.tmp.npy', base + '.npy')
+            with open(base + '.tmp', 'w') as fh:
+                json.dump(meta, fh)
+            replace_file(base + '.tmp', base + '.json')
+        except (IOError, OSError):
+            return
+        self.evict()
+
+    def entries(self):
+        "list of (last-use time, size, base path) for all cache entries"
+        out = []
+        if not os.path.isdir(self.cachedir):
+            return out
+        for fname in os.listdir(self.cachedir):
+            if not fname.endswith('.json'):
+                continue
+            base = os.path.join(self.cachedir, fname[:-5])
+            try:
+                size = os.path.getsize(base + '.json') + os.path.getsize(base + '.npy')
+                out.append((os.path.getmtime(base + '.json'), size, base))
+            except OSError:
+                pass
+        return out
+
+    def evict(self, max_size=None):
+        "remove least recently used entries until cache is under max_size"
+        if max_size is None:
+            max_size = self.max_size
+        entries = sorted(self.entries())
+        total = sum([size for atime, size, base in entries])
+        while total > max_size and len(entries) > 0:
+            atime, size, base = entries.pop(0)
+            self._remove(base)
+            total -= size
+
+    def _remove(self, base):
+        for ext in ('.json', '.npy'):
+            try:
+                os.remove(base + ext)
+            except OSError:
+                pass
+
+    def invalidate(self, filename=None):
+        "remove cache entry for a scan file, or all entries"
+        if filename is not None:
+            self._remove(self._entry(filename))
+        else:
+            for atime, size, base in self.entries():
+                self._remove(base)
+
+def _read_scanfile(filename, cache=None):
+    "read scan file, including data"
+    sdata = StepScanData(filename, cache=cache)
+    sdata.data
+    return sdata
+
+def read_scanfiles(filenames, nproc=None, cache=None):
+    """read many scan files, in parallel with a pool of nproc processes
+    (default: number of CPUs), returning a list of StepScanData"""
+    filenames = list(filenames)
+    if nproc == 1 or len(filenames) < 2:
+        return [_read_scanfile(fname, cache=cache) for fname in filenames]
+    pool = Pool(nproc)
+    try:
+        out = pool.map(partial(_read_scanfile, cache=cache), filenames)
+    finally:
+        pool.close()
+        pool.join()
+    return out
+
 class ScanFile(object):
     """base Scan File -- intended to be inherited and
     overrwritten for multiple ScanFile types (ASCII, HDF5) to be
@@ -221,6 +506,62 @@ class ScanFile(object):
         "write data"
         pass
 
+    def write_point(self):
+        "write data for the latest scan point, for streaming file types"
+        pass
+
+    def get_legend(self):
+        """return list of (object, type, label, units, pvname)
+        for each column: positioners, then counters"""
+        out = []
+        for vars  in ((self.scan.positioners, 'positioner', 'unknown'),
+                      (self.scan.counters, 'counter', 'counts')):
+            objs, objtype, objunits = vars
+            for obj in objs:
+                units = objunits
+                pv = getattr(obj, 'pv', None)
+                pvname = getattr(obj, 'pvname', None)
+                if pvname is None and pv is not None:
+                    pvname = pv.pvname
+                if pvname is None:
+                    pvname = ''
+                if obj.units in (None, 'None', ''):
+                    if pv is not None:
+                        units = getattr(pv, 'units', None)
+                else:
+                    units = obj.units
+                if units in (None, 'None', ''):
+                    units = objunits
+                out.append((obj, objtype, fix_filename(obj.label),
+                            units, pvname))
+        return out
+
+    def get_scanparams(self):
+        "return ordered dictionary of scan parameters"
+        out = OrderedDict()
+        s = self.scan
+        out['ScanType'] = s.scantype
+        regfmt = '%9.3f, %9.3f, %9.3f  %s  %.2f'
+        if 'xafs' in s.scantype.lower():
+            out['element'] = getattr(s, 'elem', 'Unknown')
+            out['edge'] = getattr(s, 'edge', 'Unknown')
+            out['E0'] = '%.3f' % s.e0
+            out['Legend'] = ' Start, Stop, Step, K-space, Time'
+            for ireg, reg in enumerate(s.regions):
+                start, stop, npts, rel, e0, use_k, dt0, dt1, dtw = reg
+                step = abs(stop-start)/(npts-1.0)
+                regtxt = regfmt % (start, stop, step, repr(use_k), dt0)
+                if dt1 is not None:
+                    regtxt = '%s .. %.2f (weight=%i)' % (regtxt, dt1, dtw)
+                out['Region%i' % (ireg+1)] = ' %s' % regtxt
+        timer = getattr(s, 'phase_timer', None)
+        if timer is not None and timer.enabled:
+            for phase, stats in timer.get_summary().items():
+                out['Time_%s' % phase] = ('mean=%.4f, p50=%.4f, p95=%.4f, max=%.4f' %
+                                          (stats['mean'], stats['p50'],
+                                           stats['p95'], stats['max']))
+        return out
+
 class ASCIIScanFile(ScanFile):
     """basis ASCII Column File, line-ending delimited,
     using '#' for comment lines
@@ -266,25 +607,8 @@ class ASCIIScanFile(ScanFile):
     def write_scanparams(self):
         "write scan parameters"
         out = ['%s ScanParameters.Start: Scan.Member: Value' % COM1]
-        s = self.scan
-        # print("WRITE SCAN PARAMS", s, s.elem, s.edge, s.e0)
-
-        out.append('%s ScanParameters.ScanType: %s' % (COM1, s.scantype))
-        regfmt = '%9.3f, %9.3f, %9.3f  %s  %.2f'
-        if 'xafs' in s.scantype.lower():
-            elem = getattr(s, 'elem', 'Unknown')
-            edge = getattr(s, 'edge', 'Unknown')
-            out.append('%s ScanParameters.element: %s' % (COM1, elem))
-            out.append('%s ScanParameters.edge: %s' % (COM1, edge))
-            out.append('%s ScanParameters.E0: %.3f' % (COM1, s.e0))
-            out.append('%s ScanParameters.Legend:  Start, Stop, Step, K-space, Time' % COM1)
-            for ireg, reg in enumerate(s.regions):
-                start, stop, npts, rel, e0, use_k, dt0, dt1, dtw = reg
-                step = abs(stop-start)/(npts-1.0)
-                regtxt = regfmt % (start, stop, step, repr(use_k), dt0)
-                if dt1 is not None:
-                    regtxt = '%s .. %.2f (weight=%i)' % (regtxt, dt1, dtw)
-                out.append('%s ScanParameters.Region%i:  %s' % (COM1, ireg+1, regtxt))
+        for key, val in self.get_scanparams().items():
+            out.append('%s ScanParameters.%s: %s' % (COM1, key, val))
         out.append('%s ScanParameters.End: here' % COM1)
         self.write_lines(out)
 
@@ -305,32 +629,12 @@ class ASCIIScanFile(ScanFile):
     def write_legend(self):
         "write legend"
         cols = []
-        icol = 0
         out = ['%s Legend.Start: Column.N: Name  units || EpicsPV' % COM1]
-        for vars  in ((self.scan.positioners, 'positioner', 'unknown'),
-                      (self.scan.counters, 'counter', 'counts')):
-            objs, objtype, objunits = vars
-            for obj in objs:
-                icol += 1
-                key = '%s Column.%i' % (COM1, icol)
-                typ, units =  objtype, objunits
-                pv = getattr(obj, 'pv', None)
-                pvname = getattr(obj, 'pvname', None)
-                if pvname is None and pv is not None:
-                    pvname = pv.pvname
-                if pvname is None:
-                    pvname = ''
-                if obj.units in (None, 'None', ''):
-                    if pv is not None:
-                        units = getattr(pv, 'units', None)
-                else:
-                    units = obj.units
-                if units in (None, 'None', ''):
-                    units = objunits
-                lab = fix_filename(obj.label)
-                sthis = "%s: %s %s %s %s" %(key, lab, units, SEP, pvname)
-                out.append(sthis)
-                cols.append(lab)
+        for icol, (obj, typ, lab, units, pvname) in enumerate(self.get_legend()):
+            key = '%s Column.%i' % (COM1, icol+1)
+            sthis = "%s: %s %s %s %s" %(key, lab, units, SEP, pvname)
+            out.append(sthis)
+            cols.append(lab)
 
         out.append('%s Legend.End: here' % COM1)
         self.write_lines(out)
@@ -347,21 +651,396 @@ class ASCIIScanFile(ScanFile):
         self.write_scanparams()
         self.write_comments()
         out = ["%s %s" % (COM1, COM3), self.column_label]
-        npts_all = [len(c.buff) for c in self.scan.counters]
-        npts_all.append(len(self.scan.pos_actual))
-        # print("DataFile: Npts: ", npts_all)
-        for i in range(min(npts_all)):
-            words =  self.scan.pos_actual[i][:]
-            words.extend([c.buff[i] for c in self.scan.counters])
+        out.extend(self.format_points())
+        self.write_lines(out)
+        if clear:
+            self.scan.clear_data()
+
+        if close_file:
+            self.close()
+            if verbose:
+                print( "Wrote and closed %s" % self.filename)
+
+    def format_points(self, start=0):
+        "return list of data lines for scan points, starting at point start"
+        out = []
+        datastore = getattr(self.scan, 'datastore', None)
+        if datastore is not None:
+            fmt = ' '.join([self.num_format]*datastore.ncols)
+            for row in datastore.get_data()[start:]:
+                out.append(fmt % tuple(row))
+        else:
+            npts_all = [len(c.buff) for c in self.scan.counters]
+            npts_all.append(len(self.scan.pos_actual))
+            for i in range(start, min(npts_all)):
+                words =  list(self.scan.pos_actual[i][:])
+                words.extend([c.buff[i] for c in self.scan.counters])
+                try:
+                    thisline = ' '.join([self.num_format % w for w in words])
+                except:
+                    thisline = ' '.join([repr(w) for w in words])
+                out.append(thisline)
+        return out
+
+    def read(self, filename=None):
+        return StepScanData(filename)
+
+
+class StreamingASCIIScanFile(ASCIIScanFile):
+    """ASCII Column File, written as points complete
+
+    The header is written when the scan starts, and each data line is
+    appended by write_point() as its point completes, so that a partial
+    file holds all points completed so far.  Breakpoints add a new
+    header section (timestamp, extra PVs, etc) without rewriting data.
+
+    Lines are queued and written by a background thread, so that the
+    scan is not blocked by disk I/O.  The fsync policy sets when the
+    file is synced to disk:
+       'never':       only flushed to the OS, after each batch of lines
+       'breakpoint':  synced at breakpoints and at close [default]
+       'batch':       synced after each batch of lines
+
+    An error in writing stops all further writes, and is raised by the
+    next call of write_point(), flush() or close().
+    """
+    fsync = 'breakpoint'
+    def __init__(self, name=None, scan=None, comments=None,
+                 auto_increment=True, fsync=None):
+        ASCIIScanFile.__init__(self, name=name, scan=scan, comments=comments,
+                               auto_increment=auto_increment)
+        if fsync is not None:
+            self.fsync = fsync
+        self.npoints = 0
+        self.queue = Queue()
+        self.thread = None
+        self.error = None
+
+    def _writer(self):
+        "write queued lines, until None is queued"
+        done = False
+        while not done:
+            lines = [self.queue.get()]
+            while True:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            ntasks = len(lines)
+            sync = False
+            if None in lines:
+                done, sync = True, True
+                lines = lines[:lines.index(None)]
             try:
-                thisline = ' '.join([self.num_format % w for w in words])
-            except:
-                thisline = ' '.join([repr(w) for w in words])
-            out.append(thisline)
+                if self.error is None:
+                    for line in lines:
+                        if line is True:
+                            sync = True
+                        else:
+                            ASCIIScanFile.write(self, '%s\n' % line)
+                    ASCIIScanFile.flush(self)
+                    if sync or self.fsync == 'batch':
+                        self.sync()
+            except Exception:
+                self.error = sys.exc_info()
+            finally:
+                for i in range(ntasks):
+                    self.queue.task_done()
 
-        self.write_lines(out)
+    def check_error(self):
+        "raise any error from the writer thread"
+        if self.error is not None:
+            error, self.error = self.error, None
+            six.reraise(*error)
+
+    def sync(self):
+        "sync file to disk, unless fsync is 'never'"
+        if self.fh is not None and self.fsync != 'never':
+            os.fsync(self.fh.fileno())
+
+    def write_lines(self, buff):
+        "queue array of text lines for writing"
+        if self.thread is None:
+            if not self.check_writeable():
+                self.open_for_write(mode='a')
+            self.queue.put("%s / %s" % (FILETOP, self.version))
+            self.thread = Thread(target=self._writer, name='scanfile_writer')
+            self.thread.daemon = True
+            self.thread.start()
+        for line in buff:
+            self.queue.put(line)
+
+    def flush(self):
+        "wait for queued lines to be written"
+        if self.thread is not None:
+            self.queue.join()
+        self.check_error()
+
+    def write_point(self):
+        "queue data lines for points not yet written"
+        self.check_error()
+        lines = self.format_points(start=self.npoints)
+        self.write_lines(lines)
+        self.npoints += len(lines)
+
+    def write_header(self, label=None):
+        "write timestamp, extra PVs, scan parameters and comments"
+        if label is not None:
+            self.write_timestamp(label=label)
+        self.write_extrapvs()
+        self.write_scanparams()
+        self.write_comments()
+        self.write_lines(["%s %s" % (COM1, COM3), self.column_label])
+
+    def write_data(self, breakpoint=0, clear=False, close_file=False, verbose=False):
+        "write header or breakpoint section; data is written per point"
+        if breakpoint == 0:
+            self.write_timestamp(label='start_time')
+            self.write_legend()
+            self.write_header()
+            return
+        self.write_point()
+        self.write_header(label='end_time')
+        self.queue.put(True)
+        if clear:
+            self.scan.clear_data()
+            self.npoints = 0
+        if close_file:
+            self.close()
+            if verbose:
+                print( "Wrote and closed %s" % self.filename)
+
+    def close(self):
+        "write remaining lines, sync, and close file"
+        try:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+        finally:
+            ASCIIScanFile.close(self)
+        self.check_error()
+
+
+H5_ENTRY = 'scan'
+
+def h5_str(val):
+    "convert HDF5 attribute value to str"
+    if isinstance(val, bytes):
+        val = val.decode('utf-8')
+    return val
+
+class HDF5ScanFile(ScanFile):
+    """HDF5 Scan File, using a NeXus-like layout:
+
+      /scan              NXentry: start_time, end_time, comments,
+                                  breakpoints attributes
+      /scan/data         NXdata: one chunked, appendable dataset per
+                                 column, and per array counter
+      /scan/extra_pvs    extra PVs as attributes {desc: (value, pvname)}
+      /scan/scan_params  scan parameters as attributes
+
+    Column datasets have 'column', 'type', 'units', and 'pvname'
+    attributes.  Counters that read one array per point (if the scan's
+    .array_counters_per_point is set) are written as 2-D datasets of
+    shape (npts, nvalues): these arrays are kept by the counters only
+    while the file is open.
+    """
+    version = '1.0'
+    chunk_size = 256
+    def __init__(self, name=None, scan=None, comments=None,
+                 auto_increment=True):
+        if not HAS_H5PY:
+            raise ImportError('HDF5ScanFile requires h5py')
+        ScanFile.__init__(self, name=name, scan=scan)
+        if name is None:
+            self.filename = 'test.h5'
+        self.auto_increment = auto_increment
+        self.comments = comments
+        self.columns = []
+        self.array_counters = []
+        self.nwritten = 0
+        self.nrows = 0
+
+    def open_for_write(self, filename=None, mode='a'):
+        """open file for write, ensuring the filename is auto-incremented
+        so as to not clobber an existing file name"""
+        if filename is not None:
+            self.filename  = filename
+        if self.auto_increment:
+            self.filename = new_filename(self.filename)
+        self.close()
+        self.fh = h5py.File(self.filename, 'w')
+        self.fh.attrs['NX_class'] = 'NXroot'
+        self.fh.attrs['file_name'] = self.filename
+        entry = self.fh.create_group(H5_ENTRY)
+        entry.attrs['NX_class'] = 'NXentry'
+        entry.attrs['creator'] = FILETOP
+        entry.attrs['version'] = self.version
+        entry.create_group('data').attrs['NX_class'] = 'NXdata'
+        entry.create_group('extra_pvs').attrs['NX_class'] = 'NXcollection'
+        entry.create_group('scan_params').attrs['NX_class'] = 'NXcollection'
+        return self.fh
+
+    def check_writeable(self):
+        "check that output file is open and writeable"
+        return self.fh is not None and bool(self.fh)
+
+    def flush(self):
+        "flush file"
+        if self.check_writeable():
+            self.fh.flush()
+
+    def write(self, s):
+        "not supported for HDF5 files"
+        raise TypeError('cannot write text to an HDF5ScanFile')
+
+    def close(self):
+        "close file, and stop counters keeping arrays for each point"
+        if self.check_writeable():
+            self.fh.close()
+        self.fh = None
+        for obj in self.array_counters:
+            obj.collect_point_arrays(False)
+        self.array_counters = []
+
+    @property
+    def entry(self):
+        if not self.check_writeable():
+            self.open_for_write()
+        return self.fh[H5_ENTRY]
+
+    def write_timestamp(self, label='start_time'):
+        "write timestamp"
+        self.entry.attrs[label] = get_timestamp()
+
+    def write_comments(self):
+        "write comments"
+        if self.comments is not None:
+            self.entry.attrs['comments'] = self.comments
+
+    def write_extrapvs(self):
+        "write extra PVs as attributes of extra_pvs group"
+        group = self.entry['extra_pvs']
+        for desc, pvname, val in self.scan.read_extra_pvs():
+            if not isinstance(val, six.string_types):
+                val = repr(val)
+            group.attrs[desc] = [val, pvname]
+
+    def write_scanparams(self):
+        "write scan parameters as attributes of scan_params group"
+        group = self.entry['scan_params']
+        for key, val in self.get_scanparams().items():
+            group.attrs[key] = val
+
+    def write_legend(self):
+        "create column datasets"
+        self.columns = []
+        names = []
+        for icol, (obj, typ, lab, units, pvname) in enumerate(self.get_legend()):
+            name = lab
+            if name in names:
+                name = '%s_%i' % (lab, icol+1)
+            names.append(name)
+            self.columns.append((name, obj, typ, units, pvname))
+
+        self.array_counters = []
+        if getattr(self.scan, 'array_counters_per_point', False):
+            npos = len(self.scan.positioners)
+            for name, obj, typ, units, pvname in self.columns[npos:]:
+                if hasattr(obj, 'collect_point_arrays'):
+                    obj.collect_point_arrays(True)
+                    self.array_counters.append(obj)
+
+    def _create_dataset(self, icol, name, typ, units, pvname, nvals=None):
+        group = self.entry['data']
+        if nvals is None:
+            shape, maxshape = (0,), (None,)
+            chunks = (self.chunk_size,)
+        else:
+            shape, maxshape = (0, nvals), (None, nvals)
+            chunks = (max(1, min(self.chunk_size, 2**20//(8*nvals))), nvals)
+        dset = group.create_dataset(name, shape=shape, maxshape=maxshape,
+                                    chunks=chunks, dtype='f8')
+        dset.attrs['column'] = icol+1
+        dset.attrs['type'] = typ
+        dset.attrs['units'] = units
+        dset.attrs['pvname'] = pvname
+        return dset
+
+    def _is_array_counter(self, obj):
+        """whether counter has read one array per scan point (as for MCA
+        spectra in a step scan), rather than one value per point"""
+        return obj in self.array_counters and len(obj.point_arrays) > 0
+
+    def _point_arrays(self, obj, start, stop):
+        """(npts, nvals) array of per-point arrays of a counter, for points
+        start to stop, padded with NaN for missing points or values"""
+        parrays = obj.point_arrays
+        nvals = max([len(a) for a in parrays])
+        group = self.entry['data']
+        for name, cobj, typ, units, pvname in self.columns:
+            if cobj is obj and name in group and group[name].ndim > 1:
+                nvals = group[name].shape[1]
+        out = np.empty((max(0, stop-start), nvals), dtype=np.float64)
+        out.fill(np.nan)
+        for i, arr in enumerate(parrays[start:stop]):
+            arr = np.asarray(arr, dtype=np.float64).ravel()[:nvals]
+            out[i, :len(arr)] = arr
+        return out
+
+    def write_data(self, breakpoint=0, clear=False, close_file=False,
+                   verbose=False):
+        """write data, appending points added since the last write"""
+        if breakpoint == 0:
+            self.write_timestamp(label='start_time')
+            self.write_legend()
+            return
+        self.write_timestamp(label='end_time')
+        self.write_extrapvs()
+        self.write_scanparams()
+        self.write_comments()
+
+        arrays = []
+        npos = len(self.scan.positioners)
+        pos = np.asarray(self.scan.pos_actual, dtype=np.float64)
+        nrows = len(pos)
+        for icol, (name, obj, typ, units, pvname) in enumerate(self.columns):
+            if icol < npos:
+                arrays.append(pos[:, icol] if nrows > 0 else pos)
+            elif self._is_array_counter(obj):
+                arrays.append(None)
+            else:
+                arrays.append(np.asarray(obj.buff, dtype=np.float64))
+        lens = [len(a) for a in arrays if a is not None]
+        npts = min(lens) if len(lens) > 0 else 0
+        nnew = max(0, npts - self.nwritten)
+
+        entry = self.entry
+        entry.attrs['breakpoints'] = list(entry.attrs.get('breakpoints', [])) + [self.nrows]
+        times = [h5_str(t) for t in entry.attrs.get('breakpoint_times', [])]
+        entry.attrs['breakpoint_times'] = times + [h5_str(entry.attrs['end_time'])]
+
+        group = entry['data']
+        for icol, (name, obj, typ, units, pvname) in enumerate(self.columns):
+            if arrays[icol] is None:
+                arr = self._point_arrays(obj, self.nwritten, npts)
+            else:
+                arr = arrays[icol][self.nwritten:npts]
+            if name not in group:
+                nvals = None
+                if arr.ndim > 1:
+                    nvals = arr.shape[1]
+                self._create_dataset(icol, name, typ, units, pvname, nvals=nvals)
+            dset = group[name]
+            dset.resize(self.nrows + nnew, axis=0)
+            dset[self.nrows:self.nrows+nnew] = arr
+        self.nrows += nnew
+        self.nwritten = npts
+        self.flush()
         if clear:
             self.scan.clear_data()
+            self.nwritten = 0
 
         if close_file:
             self.close()
@@ -0,0 +1,78 @@
+"""
+Columnar store for step scan data
+"""
+import numpy as np
+
+class ScanDataStore(object):
+    """Preallocated, columnar store of scan data
+
+    Data is held in a single float64 array of shape (npts, ncols), with
+    one row per scan point and one column per positioner or counter.
+    Values for the current point are put by column index with .set(),
+    and the row is completed with .next_row().  If more rows are needed
+    (as for retried points), the array grows.
+
+    Readers get views of completed rows only, without copying:
+        store.get_data()         array of shape (nrows, ncols)
+        store.get_column(icol)   array of shape (nrows,)
+
+    .generation is incremented by .clear(), so that readers can tell
+    when previously read rows are no longer valid.
+    """
+    def __init__(self, npts, ncols, grow_size=None):
+        self.ncols = ncols
+        self.grow_size = grow_size
+        self.generation = 0
+        self.nrows = 0
+        self.data = np.empty((max(1, npts), ncols), dtype=np.float64)
+        self.data.fill(np.nan)
+
+    def __repr__(self):
+        return "ScanDataStore(%d rows, %d columns)" % (self.nrows, self.ncols)
+
+    def grow(self, nrows=None):
+        "grow storage by nrows rows"
+        if nrows is None:
+            nrows = self.grow_size
+        if nrows is None:
+            nrows = max(16, len(self.data)//4)
+        data = np.empty((len(self.data) + nrows, self.ncols), dtype=np.float64)
+        data.fill(np.nan)
+        data[:len(self.data)] = self.data
+        self.data = data
+
+    def set(self, icol, value):
+        "set value for column icol of the current row"
+        if value is None:
+            value = np.nan
+        try:
+            self.data[self.nrows, icol] = value
+        except (TypeError, ValueError):
+            self.data[self.nrows, icol] = np.nan
+
+    def set_row(self, values, start=0):
+        "set values for columns of the current row, starting at column start"
+        for icol, value in enumerate(values):
+            self.set(start+icol, value)
+
+    def next_row(self):
+        "complete the current row, making it visible to readers"
+        if self.nrows + 1 >= len(self.data):
+            self.grow()
+        self.nrows += 1
+
+    def clear(self):
+        "clear all rows"
+        self.nrows = 0
+        self.data.fill(np.nan)
+        self.generation += 1
+
+    def get_data(self):
+        "view of all completed rows"
+        nrows = self.nrows
+        return self.data[:nrows]
+
+    def get_column(self, icol):
+        "view of completed rows for a column"
+        nrows = self.nrows
+        return self.data[:nrows, icol]
@@ -2,6 +2,14 @@
 from __future__ import print_function
 
 import time
+import json
+from collections import OrderedDict
+import numpy as np
+
+clock = getattr(time, 'perf_counter', time.time)
+
+POINT_PHASES = ('interrupts', 'move', 'settle', 'trigger', 'wait', 'read',
+                'publish', 'breakpoint')
 
 class debugtime(object):
     def __init__(self, verbose=False):
@@ -51,5 +59,91 @@ class debugtime(object):
         dat = self.get_report()
         with open(fname, 'w') as fh:
             fh.write('%s\n' % dat)
-        
-            
+
+
+class PhaseTimer(object):
+    """per-point phase timer for scans
+
+    Times for each phase of each point are accumulated in a preallocated
+    array of shape (npts, nphases), so that the cost per mark is small,
+    and is a single test when disabled.
+
+    timer = PhaseTimer(npts, enabled=True)
+    for ipt in range(npts):
+        timer.start_point(ipt)
+        <check interrupts>
+        timer.mark('interrupts')   # time since previous mark
+        ...
+    timer.get_summary()  # {phase: {'mean', 'p50', 'p95', 'max', 'total'}}
+
+    Retried points accumulate time in the same row.
+    """
+    def __init__(self, npts=1, phases=POINT_PHASES, enabled=True):
+        self.phases = tuple(phases)
+        self.index = dict((p, i) for i, p in enumerate(self.phases))
+        self.enabled = enabled
+        self.times = np.zeros((max(1, npts), len(self.phases)))
+        self.npts = 0
+        self.ipt = 0
+        self.tlast = clock()
+
+    def start_point(self, ipt):
+        "start timing for point ipt"
+        if not self.enabled:
+            return
+        if ipt >= len(self.times):
+            extra = np.zeros((max(ipt+1, 2*len(self.times)) - len(self.times),
+                              len(self.phases)))
+            self.times = np.concatenate((self.times, extra))
+        self.ipt = ipt
+        self.npts = max(self.npts, ipt+1)
+        self.tlast = clock()
+
+    def mark(self, phase):
+        "add time since last mark to phase for current point"
+        if not self.enabled:
+            return
+        now = clock()
+        self.times[self.ipt, self.index[phase]] += now - self.tlast
+        self.tlast = now
+
+    def get_times(self):
+        "array of times for points timed, shape (npts, nphases)"
+        return self.times[:self.npts]
+
+    def get_summary(self):
+        """return ordered dictionary of {phase: {'mean', 'p50', 'p95',
+        'max', 'total'}} for all points timed"""
+        out = OrderedDict()
+        times = self.get_times()
+        if len(times) == 0:
+            return out
+        p50, p95 = np.percentile(times, [50, 95], axis=0)
+        for i, phase in enumerate(self.phases):
+            out[phase] = OrderedDict((('mean', times[:, i].mean()),
+                                      ('p50', p50[i]), ('p95', p95[i]),
+                                      ('max', times[:, i].max()),
+                                      ('total', times[:, i].sum())))
+        return out
+
+    def get_report(self):
+        "text report of summary"
+        out = ["#  Phase          Mean       P50       P95       Max     Total"]
+        for phase, stats in self.get_summary().items():
+            out.append("  %-12s %9.4f %9.4f %9.4f %9.4f %9.3f" %
+                       (phase, stats['mean'], stats['p50'], stats['p95'],
+                        stats['max'], stats['total']))
+        return "\n".join(out)
+
+    def save_json(self, fname):
+        "save summary to JSON file"
+        with open(fname, 'w') as fh:
+            json.dump({'npts': self.npts, 'summary': self.get_summary()},
+                      fh, indent=1)
+
+    def save_csv(self, fname):
+        "save per-point times to CSV file"
+        with open(fname, 'w') as fh:
+            fh.write('point,%s\n' % ','.join(self.phases))
+            for ipt, row in enumerate(self.get_times()):
+                fh.write('%d,%s\n' % (ipt, ','.join(['%.6f' % t for t in row])))
@@ -17,7 +17,7 @@ from ..file_utils import fix_filename
 from .xrd_calibration import read_poni, write_poni
 from .trigger import Trigger
 from .counter import (Counter, DummyCounter, DeviceCounter,
-                      MotorCounter, ROISumCounter)
+                      MotorCounter, ROISumCounter, CounterGroup)
 
 from .base  import DetectorMixin, SimpleDetector, MotorDetector
 from .base  import SCALER_MODE, ROI_MODE, NDARRAY_MODE
@@ -31,6 +31,7 @@ from .ad_perkinelmer import AD_PerkinElmer
 from .ad_pilatus import AD_Pilatus
 from .ad_eiger import AD_Eiger
 from .ad_integrator import AD_Integrator, read_poni
+from .detgroup import DetectorGroup
 
 DET_DEFAULT_OPTS = {'scaler': {'use_calc': True, 'nchans': 8},
                     'tetramm': {'nchans': 4},
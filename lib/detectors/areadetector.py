@@ -13,7 +13,7 @@ from ..file_utils import fix_varname
 
 AD_FILESAVERS = ('TIFF1:', 'JPEG1:', 'netCDF1:', 'HDF1:', 'Nexus1:')
 
-AD_CAM_ATTRS = ("Acquire", "AcquirePeriod", "AcquirePeriod_RBV",
+AD_CAM_ATTRS = ("Acquire", "Acquire_RBV", "AcquirePeriod", "AcquirePeriod_RBV",
                 "AcquireTime", "AcquireTime_RBV", "ArrayCallbacks",
                 "ArrayCallbacks_RBV", "ArrayCounter", "ArrayCounter_RBV",
                 "ArrayRate_RBV", "ArraySizeX_RBV", "ArraySizeY_RBV",
@@ -519,6 +519,15 @@ class AreaDetector(DetectorMixin):
             self.disarm()
         self.ad.FileCaptureOff()
 
+    def is_armed(self):
+        "return whether file capture is on (NDArray mode only)"
+        if self.mode != NDARRAY_MODE:
+            return None
+        return self.ad.fileGet('Capture_RBV') == 1
+
+    def is_acquiring(self):
+        return self.cam.get('Acquire_RBV') == 1
+
     def save_arraydata(self, filename=None):
         pass
 
@@ -76,6 +76,14 @@ class DetectorMixin(Saveable):
         "stop detector, optionally setting mode, disarming, and waiting"
         pass
 
+    def is_armed(self):
+        "return whether detector is armed, or None if there is no readback"
+        return None
+
+    def is_acquiring(self):
+        "return whether detector is acquiring, or None if there is no readback"
+        return None
+
     def save_arraydata(self, filename=None):
         "save array data to external file"
         pass
@@ -3,17 +3,53 @@ Basic Counter
 """
 import numpy as np
 from collections import OrderedDict
-from epics import get_pv, caget, poll
+from epics import get_pv, caget, poll, ca
 
 from ..saveable import Saveable
 from ..file_utils import fix_varname
 
 EVAL4PLOT= '@@'
-class Counter(Saveable):
+
+class ColumnBuffer(object):
+    """mixin for counters whose buffer may be a column of a ScanDataStore
+
+    Once attached to a store, values are put into the store column, and
+    .buff is a view of that column.  Assigning to .buff (as with clear())
+    detaches the counter from the store.
+    """
+    store = None
+    column = None
+    _buff = None
+
+    def attach_store(self, store, column):
+        "use column of ScanDataStore for buffer"
+        self.store = store
+        self.column = column
+
+    @property
+    def buff(self):
+        if self.store is not None:
+            return self.store.get_column(self.column)
+        return self._buff
+
+    @buff.setter
+    def buff(self, value):
+        self.store = None
+        self._buff = value
+
+    def append_value(self, value):
+        "append value for the current point to buffer"
+        if self.store is not None:
+            self.store.set(self.column, value)
+        else:
+            self._buff.append(value)
+
+class Counter(ColumnBuffer, Saveable):
     """simple scan counter object
     a value that will be counted at each point
     in a step scan
     """
+    point_arrays = None
     def __init__(self, pvname, label=None, units=''):
         Saveable.__init__(self, pvname, label=label, units=units)
         self.pvname = pvname
@@ -29,18 +65,36 @@ class Counter(Saveable):
 
     def read(self, **kws):
         "read counter to internal buffer"
-        val = self.pv.get(**kws)
+        return self.set_value(self.pv.get(**kws))
+
+    def set_value(self, val):
+        """put value read elsewhere (such as by a CounterGroup) to buffer.
+
+        An array value replaces the buffer.  If enabled with
+        collect_point_arrays(), it is also kept in .point_arrays, so that
+        arrays read at each point (such as MCA spectra in a step scan)
+        are all available."""
+        if (self.point_arrays is not None and
+            isinstance(val, (np.ndarray, list, tuple))):
+            self.point_arrays.append(np.asarray(val))
         if isinstance(val, np.ndarray):
             self.buff = val.tolist()
         elif isinstance(val, (list, tuple)):
             self.buff = list(val)
         else:
-            self.buff.append(val)
+            self.append_value(val)
         return self.buff
 
     def clear(self):
         "clear counter"
         self.buff = []
+        if self.point_arrays is not None:
+            self.point_arrays = []
+
+    def collect_point_arrays(self, collect=True):
+        """turn on or off keeping each array value in .point_arrays
+        (None when off), as used by HDF5ScanFile"""
+        self.point_arrays = [] if collect else None
 
     def get_buffers(self):
         "return {label: buffer} dictionary"
@@ -84,7 +138,7 @@ class MotorCounter(Counter):
         Counter.__init__(self, pvname, label=label)
 
 
-class ROISumCounter(Saveable):
+class ROISumCounter(ColumnBuffer, Saveable):
     """
     ROI Sum counter as for Xspress3 ROIs or using AD ROIstats plugin
     use dtcfmt='1' to mean no deadtime correction
@@ -116,9 +170,13 @@ class ROISumCounter(Saveable):
                                              self.label, self.roifmt,
                                              self.dtcfmt, self.nmcas)
 
-    def read(self, **kws):
-        if self.data is not None:
-            vals = [self.data[pv.pvname] for pv in self.roi_pvs]
+    def read(self, data=None, **kws):
+        """read ROI sums, using optional dictionary {pvname: value} of
+        values already read (by a CounterGroup, for example)"""
+        if data is None:
+            data = self.data
+        if data is not None:
+            vals = [data[pv.pvname] for pv in self.roi_pvs]
         else:
             vals = [pv.get(**kws) for pv in self.roi_pvs]
         val, npts = 0.0, None
@@ -134,9 +192,9 @@ class ROISumCounter(Saveable):
             dx, nd = 1.0, 0
             if self.dtcorr:
                 dtc_pvname = self.dtc_pvs[i].pvname
-                if self.data is not None and dtc_pvname in self.data:
+                if data is not None and dtc_pvname in data:
                     try:
-                        dx = self.data[dtc_pvname]
+                        dx = data[dtc_pvname]
                     except:
                         dx = 1.0
                 else:
@@ -157,7 +215,7 @@ class ROISumCounter(Saveable):
             else:
                 val += v[:npts]*dtc[:npts]
         if npts == 1:
-            self.buff.append(val)
+            self.append_value(val)
         else:
             self.buff = val.tolist()
         return self.buff
@@ -171,6 +229,68 @@ class ROISumCounter(Saveable):
         return {self.label: self.buff}
 
 
+class CounterGroup(object):
+    """Group of counters read together, as at each point of a scan
+
+    Rather than one synchronous get per PV, all get requests for the
+    PVs of the Counters and ROISumCounters in the group are issued at
+    once, the CA buffer is flushed once, and then all values are
+    collected and put to the counter buffers in one pass.  Other
+    counters are read with their own read() method.
+
+    grp = CounterGroup(counters, timeout=5.0)
+    grp.read()
+
+    The CA layer to use can be given with `ca_module`, which defaults
+    to epics.ca, and can be replaced with a mock for testing.
+    """
+    def __init__(self, counters, timeout=5.0, ca_module=None):
+        self.counters = list(counters)
+        self.timeout = timeout
+        self.ca = ca if ca_module is None else ca_module
+        self.pvs = OrderedDict()
+        self.others = []
+        for counter in self.counters:
+            if isinstance(counter, Counter):
+                self.pvs[counter.pv.pvname] = counter.pv
+            elif isinstance(counter, ROISumCounter) and counter.data is None:
+                for pv in counter.roi_pvs + counter.dtc_pvs:
+                    self.pvs[pv.pvname] = pv
+            else:
+                self.others.append(counter)
+
+    def __repr__(self):
+        return "CounterGroup(%d counters, %d pvs)" % (len(self.counters),
+                                                     len(self.pvs))
+
+    def read_pvs(self):
+        "read all PVs, returning dictionary of {pvname: value}"
+        pending = []
+        data = {}
+        for pvname, pv in self.pvs.items():
+            if pv.connected:
+                self.ca.get(pv.chid, wait=False)
+                pending.append((pvname, pv))
+            else:
+                data[pvname] = None
+        self.ca.flush_io()
+        for pvname, pv in pending:
+            data[pvname] = self.ca.get_complete(pv.chid, timeout=self.timeout)
+        return data
+
+    def read(self):
+        "read all counters to their internal buffers"
+        data = self.read_pvs()
+        for counter in self.counters:
+            if isinstance(counter, Counter):
+                counter.set_value(data[counter.pv.pvname])
+            elif isinstance(counter, ROISumCounter) and counter.data is None:
+                counter.read(data=data)
+        for counter in self.others:
+            counter.read()
+        return data
+
+
 class DeviceCounter(object):
     """Generic Multi-PV Counter
 
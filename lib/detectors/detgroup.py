@@ -0,0 +1,87 @@
+"""
+DetectorGroup: arm, start, and stop a set of detectors in parallel
+"""
+import sys
+import time
+import six
+from epics.ca import CAThread
+
+class DetectorGroup(object):
+    """group of detectors to be armed, started and stopped together
+
+    Each action is run for all detectors at the same time, in one thread
+    per detector.  After a detector's arm() or start() returns, its
+    readback (det.is_armed() or det.is_acquiring()) is polled until the
+    detector is ready, up to timeout seconds.  Detectors that have no
+    readback (returning None) wait their arm_delay or start_delay instead.
+
+    After each action, .latency holds the time in seconds for each
+    detector (keyed by label) from the call to ready, and .not_ready
+    lists labels of detectors that did not become ready.
+    Any exception from a detector is re-raised, once all are done.
+    """
+    def __init__(self, detectors, timeout=2.0, poll_time=0.005):
+        self.detectors = list(detectors)
+        self.timeout = timeout
+        self.poll_time = poll_time
+        self.latency = {}
+        self.not_ready = []
+        self.error = None
+
+    def __repr__(self):
+        return "DetectorGroup(%s)" % (', '.join([d.label for d in self.detectors]))
+
+    def arm(self, **kws):
+        "arm all detectors, waiting until armed"
+        return self._fanout('arm', kws, ready='is_armed', delay='arm_delay')
+
+    def start(self, **kws):
+        "start all detectors, waiting until acquiring"
+        return self._fanout('start', kws, ready='is_acquiring', delay='start_delay')
+
+    def stop(self, **kws):
+        "stop all detectors, waiting until no longer acquiring"
+        return self._fanout('stop', kws, ready='is_acquiring', expected=False)
+
+    def _fanout(self, action, kws, ready=None, delay=None, expected=True):
+        """run det.action(**kws) for all detectors in parallel,
+        returning list of labels of detectors that are not ready"""
+        self.latency = {}
+        self.not_ready = []
+        self.error = None
+        threads = []
+        for det in self.detectors:
+            th = CAThread(target=self._run, name='det_%s_%s' % (action, det.label),
+                          args=(det, action, kws, ready, delay, expected))
+            th.start()
+            threads.append(th)
+        for th in threads:
+            th.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            six.reraise(*error)
+        return self.not_ready
+
+    def _run(self, det, action, kws, ready, delay, expected):
+        "run action for one detector, then wait for it to be ready"
+        t0 = time.time()
+        try:
+            getattr(det, action)(**kws)
+            if ready is not None and not self._wait_ready(det, ready, delay,
+                                                          expected, t0):
+                self.not_ready.append(det.label)
+        except Exception:
+            self.error = sys.exc_info()
+        self.latency[det.label] = time.time() - t0
+
+    def _wait_ready(self, det, ready, delay, expected, t0):
+        "poll det.ready() until it returns expected, or wait its fixed delay"
+        state = getattr(det, ready)()
+        if state is None:
+            if delay is not None:
+                time.sleep(max(0, getattr(det, delay, 0) - (time.time()-t0)))
+            return True
+        while bool(state) != expected and (time.time()-t0) < self.timeout:
+            time.sleep(self.poll_time)
+            state = getattr(det, ready)()
+        return bool(state) == expected
@@ -412,6 +412,9 @@ class StruckDetector(DetectorMixin):
         "stop detector"
         self.struck.stop()
 
+    def is_acquiring(self):
+        return self.struck.get('Acquiring') == 1
+
     def save_arraydata(self, filename=None, npts=None):
         if filename is not None:
             return self.struck.save_arraydata(filename=filename, npts=npts)
@@ -2,53 +2,112 @@
 Detector Trigger
 """
 from time import time
-from epics import get_pv, poll
+from threading import Event
+import numpy as np
+from epics import get_pv
 
 from ..saveable import Saveable
 
+# bin edges (in seconds) for the trigger runtime histogram
+RUNTIME_BINS = np.array([0, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                         0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, np.inf])
+
 class Trigger(Saveable):
     """
 Detector Trigger for a scan. The interface is:
     trig = Trigger(pvname, value=1)
          defines a trigger PV and trigger value
 
-    trig.start(value=None)
-         starts the trigger (value will override value set on creation)
+    trig.start(value=None, expected=None)
+         starts the trigger (value will override value set on creation,
+         expected is the expected runtime, used to count overruns)
+
+    trig.wait(timeout=None)
+         wait for the start to complete, returns whether it completed.
 
     trig.done       True if the start has completed.
     trig.runtime    time for last .start() to complete
 
+    trig.get_stats()  dictionary of runtime statistics, with number
+                      of starts, overruns, mean and max runtime and
+                      a histogram of runtimes (bins in RUNTIME_BINS)
+
 Example usage:
     trig = Trigger(pvname)
     trig.start()
-    while not trig.done:
-        time.sleep(1.e-4)
+    trig.wait(timeout=10)
     <read detector data>
     """
+    overrun_factor = 1.5
+    overrun_margin = 0.1
     def __init__(self, pvname, value=1, **kws):
         Saveable.__init__(self, pvname, value=value, **kws)
         self.pv = get_pv(pvname)
         self._val = value
         self.done = False
+        self.done_event = Event()
         self._t0 = 0
+        self._expected = None
+        self._overrun = False
         self.runtime = -1
+        self.clear_stats()
 
     def __repr__(self):
         return "trigger(%s, value=%i)" % (self.pv.pvname, self._val)
 
     def __onComplete(self, **kws):
-        self.done = True
         self.runtime = time() - self._t0
+        self.done = True
+        self.done_event.set()
+        self.nstarts += 1
+        self.runtime_sum += self.runtime
+        self.runtime_max = max(self.runtime_max, self.runtime)
+        self.runtime_hist[np.searchsorted(RUNTIME_BINS, self.runtime,
+                                          side='right')-1] += 1
+        if (self._expected is not None and not self._overrun and
+            self.runtime > (self.overrun_factor*self._expected +
+                            self.overrun_margin)):
+            self._overrun = True
+            self.noverruns += 1
+
+    def clear_stats(self):
+        """clear runtime statistics"""
+        self.nstarts = 0
+        self.noverruns = 0
+        self.runtime_sum = 0.0
+        self.runtime_max = 0.0
+        self.runtime_hist = np.zeros(len(RUNTIME_BINS)-1, dtype=int)
 
-    def start(self, value=1):
+    def get_stats(self):
+        """return dictionary of runtime statistics"""
+        mean = 0.0
+        if self.nstarts > 0:
+            mean = self.runtime_sum/self.nstarts
+        return {'nstarts': self.nstarts, 'noverruns': self.noverruns,
+                'mean': mean, 'max': self.runtime_max,
+                'bins': RUNTIME_BINS.tolist(),
+                'hist': self.runtime_hist.tolist()}
+
+    def start(self, value=1, expected=None):
         """triggers detector"""
         self.done = False
+        self.done_event.clear()
         self.runtime = -1
+        self._expected = expected
+        self._overrun = False
         self._t0 = time()
         if value is None:
             value = self._val
         self.pv.put(value, callback=self.__onComplete)
-        poll(0.001, 0.5)
+
+    def wait(self, timeout=None):
+        """wait for trigger to complete, returns whether it completed.
+        A wait that times out counts as an overrun"""
+        done = self.done_event.wait(timeout)
+        if not done and not self._overrun:
+            self._overrun = True
+            self.noverruns += 1
+        return done
 
     def abort(self, value=0, wait=False):
         """abort trigger"""
@@ -576,6 +576,15 @@ class Xspress3Detector(DetectorMixin):
         if disarm:
             self.disarm()
 
+    def is_armed(self):
+        "return whether file capture is on (NDArray mode only)"
+        if self.mode != NDARRAY_MODE:
+            return None
+        return self._xsp3.fileGet('Capture_RBV') == 1
+
+    def is_acquiring(self):
+        return self._xsp3.get('Acquire_RBV') == 1
+
     def save_arraydata(self, filename=None):
         pass
 
@@ -180,6 +180,16 @@ def increment_filename(inpfile,ndigits=3, delim='.'):
         fout     = pathOf(dirname, base, ext, delim=delim)
     return fout
 
+def replace_file(src, dest):
+    """rename file src to dest, replacing dest if it exists.
+    This is atomic except on Windows with Python 2, where dest is
+    removed first."""
+    if hasattr(os, 'replace'):
+        return os.replace(src, dest)
+    if os.name == 'nt' and os.path.exists(dest):
+        os.remove(dest)
+    return os.rename(src, dest)
+
 def new_filename(fname=None,ndigits=3):
     """ generate a new file name, either based on
     filename or generating a random one
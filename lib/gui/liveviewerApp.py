@@ -12,6 +12,7 @@ import json
 import logging
 import numpy as np
 from random import randrange
+from collections import OrderedDict
 
 import wx
 import wx.lib.agw.flatnotebook as flat_nb
@@ -46,6 +47,29 @@ def randname(n=6):
 
 
 CURSCAN, SCANGROUP = '< Current Scan >', 'scandat'
+STATUS_KEYS = ('filename', 'scan_status', 'scan_progress')
+
+class LiveArray(object):
+    """growable array of values for a live scan column"""
+    def __init__(self, size=256):
+        self.data = np.empty(max(16, size))
+        self.npts = 0
+
+    def put(self, start, values):
+        "put values for points start, start+1, ..."
+        end = start + len(values)
+        if end > len(self.data):
+            data = np.empty(max(end, 2*len(self.data)))
+            data[:self.npts] = self.data[:self.npts]
+            self.data = data
+        self.data[start:end] = values
+        self.npts = max(self.npts, end)
+
+    def get(self, npts=None):
+        "view of the first npts values"
+        if npts is None:
+            npts = self.npts
+        return self.data[:min(npts, self.npts)]
 
 class ScanViewerFrame(wx.Frame):
     _about = """Scan Viewer,  Matt Newville <newville @ cars.uchicago.edu>  """
@@ -98,6 +122,9 @@ class ScanViewerFrame(wx.Frame):
             self.live_scanfile = None
             self.live_cpt = -1
             self.total_npts = 1
+            self.status_version = None
+            self.live_arrays = None
+            self.live_ids = []
             self.scantimer = wx.Timer(self)
             self.Bind(wx.EVT_TIMER, self.onScanTimer, self.scantimer)
             self.scantimer.Start(300)
@@ -111,10 +138,15 @@ class ScanViewerFrame(wx.Frame):
         if self.lgroup is None:
             return
         try:
-            curfile   = fix_filename(self.get_info('filename'))
-            sdata     = self.scandb.get_scandata()
-            scan_stat = self.get_info('scan_status')
-            msg       = self.get_info('scan_progress')
+            version, info = self.scandb.get_status_snapshot(STATUS_KEYS,
+                                        since_version=self.status_version)
+            if info is None:
+                return
+            self.status_version = version
+            curfile   = fix_filename(info['filename'])
+            sdata     = self.read_scandata(newfile=(curfile != self.live_scanfile))
+            scan_stat = info['scan_status']
+            msg       = info['scan_progress']
         except:
             logging.exception("No Scan at ScanTime")
             return
@@ -122,11 +154,9 @@ class ScanViewerFrame(wx.Frame):
             return
         npts = 1e200
         try:
-            # npts = len(sdata[-1].data)
-            for s in sdata:
-                n = len(s.data)
-                if n > 0:
-                    npts = min(npts, n)
+            for arr in self.live_arrays.values():
+                if arr.npts > 0:
+                    npts = min(npts, arr.npts)
         except:
             npts = 0
         if npts <= 0 or msg.lower().startswith('preparing'):
@@ -162,14 +192,8 @@ class ScanViewerFrame(wx.Frame):
             # print 'Scan Timer no reason to plot', do_newplot, self.scan_inprogress
             return
 
-        for row in sdata:
-            dat = row.data
-            if self.scandb_server == 'sqlite':
-                dat = json.loads(dat.replace('{', '[').replace('}', ']'))
-            dat = np.array(dat)
-            if len(dat) > npts:
-                dat = dat[:npts]
-            setattr(self.lgroup, fix_varname(row.name), dat)
+        for name, arr in self.live_arrays.items():
+            setattr(self.lgroup, fix_varname(name), arr.get(npts))
 
         if ((npts > 1 and npts != self.live_cpt)  or
             (time.time() - self.last_plot_update) > 15.0):
@@ -181,6 +205,35 @@ class ScanViewerFrame(wx.Frame):
         # print(" Scan Timer ", do_newplot, npts)
 
 
+    def read_scandata(self, newfile=False):
+        """read new scan data into local arrays, fetching only points
+        beyond those already read, unless newfile is True or the
+        scandata columns have changed.
+
+        returns list of scandata rows (ScanDataArray) for the columns
+        """
+        since = None
+        if newfile:
+            self.live_arrays = None
+        elif self.live_arrays is not None:
+            counts = [arr.npts for arr in self.live_arrays.values() if arr.npts > 0]
+            if len(counts) > 0:
+                since = min(counts)
+        sdata = self.scandb.get_scandata(since=since)
+        # scandata rows are re-created or re-set for each new scan,
+        # while appended chunks leave the row id and modify_time alone
+        ids = [(row.id, row.modify_time) for row in sdata]
+        if self.live_arrays is None or ids != self.live_ids:
+            if since is not None:
+                sdata = self.scandb.get_scandata()
+            self.live_ids = [(row.id, row.modify_time) for row in sdata]
+            self.live_arrays = OrderedDict()
+            for row in sdata:
+                self.live_arrays[row.name] = LiveArray(len(row.data))
+        for row in sdata:
+            self.live_arrays[row.name].put(row.start, row.data)
+        return sdata
+
     def set_column_names(self, sdata):
         """set column names from values read from scandata table"""
         if len(sdata) < 1:
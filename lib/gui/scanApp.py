@@ -153,6 +153,7 @@ class ScanFrame(wx.Frame):
 
         self.last_scanname = ''
         self.scan_started = False
+        self.status_version = None
 
         self.scandb = ScanDB()
         self.scantype = 'slew'
@@ -263,6 +264,8 @@ class ScanFrame(wx.Frame):
 
         scan['pos_settle_time'] = float(sdb.get_info('pos_settle_time', default=0.))
         scan['det_settle_time'] = float(sdb.get_info('det_settle_time', default=0.))
+        scan['adaptive_settle'] = sdb.get_info('pos_adaptive_settle', default=0,
+                                               as_bool=True)
         scan['rois'] = json.loads(sdb.get_info('rois', default='[]'))
 
         scan['detectors'] = []
@@ -336,6 +339,7 @@ class ScanFrame(wx.Frame):
         self.statusbar.SetStatusText('Waiting....', 0)
         self.scantype = scan.get('type', 'linear')
         self.scan_started = False
+        self.status_version = None
         self.scantimer.Start(100)
 
     def onDebugScan(self, evt=None):
@@ -364,21 +368,27 @@ class ScanFrame(wx.Frame):
         fout.close()
 
     def onScanTimer(self, evt=None):
+        version, info = self.scandb.get_status_snapshot(
+            ('scan_progress', 'scan_status', 'filename'),
+            since_version=self.status_version)
+        if info is None:
+            return
+        self.status_version = version
         try:
-            prog =self.scandb.get_info('scan_progress')
+            prog = info['scan_progress']
             self.statusbar.SetStatusText(prog, 0)
         except:
             print("no scan info scan_progress")
             pass
 
-        status = self.scandb.get_info('scan_status')
+        status = info['scan_status']
         if status == 'running' and not self.scan_started:
             self.scan_started = True
 
         if status == 'idle' and self.scan_started:
             self.scan_started = False
             ipan, pan = self.get_nbpage(self.scantype)
-            fname = self.scandb.get_info('filename')
+            fname = info['filename']
             try:
                 pan.filename.SetValue(new_filename(fname))
             except:
@@ -90,6 +90,7 @@ class PlotterFrame(wx.Frame):
         if dbname is not None:
             self.live_scanfile = None
             self.live_cpt = -1
+            self.status_version = None
             self.filelist.Append(CURSCAN)
             self.scantimer = wx.Timer(self)
             self.Bind(wx.EVT_TIMER, self.onScanTimer, self.scantimer)
@@ -100,7 +101,12 @@ class PlotterFrame(wx.Frame):
             return
         group =  getattr(self.larch.symtable, SCANGROUP)
 
-        curfile = fix_filename(self.scandb.get_info('filename'))
+        version, info = self.scandb.get_status_snapshot(
+            ('filename', 'scan_progress'), since_version=self.status_version)
+        if info is None:
+            return
+        self.status_version = version
+        curfile = fix_filename(info['filename'])
         if curfile != self.live_scanfile:
             self.live_scanfile = curfile
             group.filename = self.live_scanfile
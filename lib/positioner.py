@@ -2,6 +2,7 @@
 Positioner for Step Scan
 """
 import time
+from threading import Event
 import numpy as np
 from epics  import PV, caget, get_pv
 from .saveable import Saveable
@@ -11,9 +12,15 @@ class Positioner(Saveable):
     This sets an ordinate value for scan.
 
     Not that it does *NOT* implay a readback on this position -- add a Counter for that!
+
+    For adaptive settling, .settle() watches a readback PV (by default,
+    the .RBV field for a motor record) until it stays within .settle_tol
+    of the target for .settle_window seconds.  If settle_tol is None,
+    5% of the smallest step in the positioner array is used.
     """
     def __init__(self, pvname, label=None, array=None, units=None,
-                 extra_pvs=None, **kws):
+                 extra_pvs=None, readback=None, settle_tol=None,
+                 settle_window=0.02, **kws):
         Saveable.__init__(self, pvname, label=label, units=units,
                           array=array, extra_pvs=extra_pvs, **kws)
         if isinstance(pvname, PV):
@@ -22,6 +29,15 @@ class Positioner(Saveable):
             self.pv = get_pv(pvname)
         self.pv.connect()
         self.done = False
+        self.done_event = Event()
+        self.target = None
+        self.readback = readback
+        self.rbv_pv = None
+        self.settle_tol = settle_tol
+        self.settle_window = settle_window
+        self.settle_poll = 0.002
+        self._auto_tol = (None, 0)
+        self.clear_settle_stats()
         self.units = units
         if self.pv.connected:
             self.pv.get_ctrlvars()
@@ -58,6 +74,7 @@ class Positioner(Saveable):
 
     def __onComplete(self, pvname=None, **kws):
         self.done = True
+        self.done_event.set()
 
     def set_array(self, start, stop, npts):
         """set positioner array with start/stop/step/npts"""
@@ -94,12 +111,102 @@ class Positioner(Saveable):
         if self.array is None or not self.pv.connected:
             return
         self.done = False
+        self.done_event.clear()
+        self.target = self.array[i]
         self.pv.put(self.array[i], callback=self.__onComplete)
-        time.sleep(1.e-4)
         if wait:
-            t0 = time.time()
-            while not self.done and time.time()-t0 < timeout:
-                time.sleep(1.e-4)
+            self.done_event.wait(timeout)
+
+    def wait(self, timeout=None):
+        """wait for the last move_to_pos() to complete,
+        returning whether it completed before timeout"""
+        return self.done_event.wait(timeout)
+
+    def get_readback(self, timeout=0.5):
+        """return readback PV used for settling, or None if not available"""
+        if self.rbv_pv is None:
+            rbv = self.readback
+            if rbv is None:
+                pvname = self.pv.pvname
+                if pvname.endswith('.VAL'):
+                    pvname = pvname[:-4]
+                if '.' in pvname:
+                    return None
+                rbv = '%s.RBV' % pvname
+            if not isinstance(rbv, PV):
+                rbv = get_pv(rbv)
+            if not rbv.wait_for_connection(timeout=timeout):
+                return None
+            self.rbv_pv = rbv
+        return self.rbv_pv
+
+    def get_settle_tol(self):
+        "tolerance for settling"
+        if self.settle_tol is not None:
+            return self.settle_tol
+        array = self.array
+        if self._auto_tol[0] is not array:
+            tol = 0
+            if array is not None and len(array) > 1:
+                steps = abs(np.diff(np.asarray(array, dtype=float)))
+                steps = steps[steps > 0]
+                if len(steps) > 0:
+                    tol = 0.05*steps.min()
+            self._auto_tol = (array, tol)
+        return self._auto_tol[1]
+
+    def settle(self, maxtime):
+        """wait for the readback to settle at the target of the last
+        move_to_pos(), for at most maxtime seconds.
+
+        returns (time taken, whether readback settled)
+        """
+        t0 = time.time()
+        rbv = self.get_readback()
+        if rbv is None or self.target is None:
+            time.sleep(maxtime)
+            return maxtime, False
+        tol = self.get_settle_tol()
+        window = min(self.settle_window, 0.5*maxtime)
+        settled, in_band = False, None
+        while True:
+            now = time.time()
+            val = rbv.get()
+            if val is not None and abs(val - self.target) <= tol:
+                if in_band is None:
+                    in_band = now
+                if now - in_band >= window:
+                    settled = True
+                    break
+            else:
+                in_band = None
+            if now - t0 >= maxtime:
+                break
+            time.sleep(self.settle_poll)
+        dt = time.time() - t0
+        self.settle_times.append(dt)
+        if not settled:
+            self.settle_timeouts += 1
+        return dt, settled
+
+    def clear_settle_stats(self):
+        "clear settling statistics"
+        self.settle_times = []
+        self.settle_timeouts = 0
+
+    def get_settle_stats(self):
+        """return dictionary of settling statistics:
+        npts, ntimeouts, and mean, p50, p95, max settle times"""
+        times = np.array(self.settle_times)
+        out = {'npts': len(times), 'ntimeouts': self.settle_timeouts,
+               'tol': float(self.get_settle_tol()),
+               'window': self.settle_window}
+        if len(times) > 0:
+            out.update({'mean': times.mean(),
+                        'p50': np.percentile(times, 50),
+                        'p95': np.percentile(times, 95),
+                        'max': times.max()})
+        return out
 
     def pre_scan(self, **kws):
         "method to run prior to scan: override for real action"
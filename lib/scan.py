@@ -87,7 +87,10 @@ import os
 import sys
 import shutil
 import time
-from threading import Thread
+import logging
+from threading import Thread, Timer, Lock, Event
+from collections import OrderedDict
+from six.moves.queue import Queue, Full, Empty
 import json
 import numpy as np
 import random
@@ -98,57 +101,346 @@ from .file_utils import fix_varname, fix_filename, increment_filename
 from epics import PV, poll, get_pv, caget, caput
 
 from .utils import ScanDBException, ScanDBAbort, hms
-from .detectors import (Counter, Trigger, AreaDetector, SCALER_MODE)
-from .datafile import ASCIIScanFile
+from .detectors import (Counter, CounterGroup, Trigger, AreaDetector,
+                        SCALER_MODE)
+from .datafile import ASCIIScanFile, StreamingASCIIScanFile, HDF5ScanFile
+from .datastore import ScanDataStore
 from .positioner import Positioner
 
-from .debugtime import debugtime
+from .debugtime import debugtime, PhaseTimer
 
 MIN_POLL_TIME = 1.e-3
 
-class ScanPublisher(Thread):
+class ScanPublisher(object):
     """ Provides a way to run user-supplied functions per scan point,
-    in a separate thread, so as to not delay scan operation.
+    in separate worker threads, so as to not delay scan operation.
 
     Initialize a ScanPublisher with a function to call per point, and the
-    StepScan instance.  On .start(), a separate thread will createrd and
-    the .run() method run.  Here, this runs a loop, looking at the .cpt
-    attribute.  When this .cpt changes, the executing will run the user
-    supplied code with arguments of 'scan=scan instance', and 'cpt=cpt'
-
-    Thus, at each point in the scan the scanning process should set .cpt,
-    and the user-supplied func will execute.
-
-    To stop the thread, set .cpt to None.  The thread will also automatically
-    stop if .cpt has not changed in more than 1 hour
+    StepScan instance.  On .start(), nworkers worker threads are started.
+    At each point, the scan calls .put(cpt), which never blocks, and a
+    worker will run the user supplied code with arguments of
+    'scan=scan instance', and 'cpt=cpt'.
+
+    A worker takes all point events that have queued up while it was
+    busy, and calls the function once with the latest point, so that a
+    slow function publishes fewer, more recent points.  If the queue of
+    at most maxsize events is full, the oldest event is dropped.  With
+    more than one worker, calls of the function are still run one at a
+    time, and a point older than one already published is skipped.
+
+    To stop the workers, call .stop() or .join(): points already queued
+    will be published first, and points put after .stop() are ignored.
+    For compatibility, setting .cpt queues a point, and setting .cpt to
+    None stops the workers.
+
+    .get_stats() returns a dictionary of counts of points queued,
+    published, coalesced, dropped, and errors, and the current and
+    maximum queue depth.
     """
-    # number of seconds to wait for .cpt to change before exiting thread
-    timeout = 3600.
-    def __init__(self, func=None, scan=None, cpt=-1, npts=None, func_kws=None):
-        Thread.__init__(self)
+    def __init__(self, func=None, scan=None, cpt=-1, npts=None, func_kws=None,
+                 maxsize=256, nworkers=1):
         self.func = func
-        self.cpt = cpt
+        self._cpt = cpt
         self.func_kws = func_kws or {}
         self.func_kws.update({'npts': npts, 'scan': scan})
-
-    def run(self):
-        """execute thread, watching the .cpt attribute. Any chnage will
-        cause self.func(cpt=self.cpt, scan=self.scan) to be run.
-        The thread will stop when .pt == None or has not changed in
-        a time  > .timeout
-        """
-        last_point = self.cpt
-        t0 = time.time()
-
+        self.nworkers = max(1, nworkers)
+        self.queue = Queue(maxsize=maxsize)
+        self.lock = Lock()
+        self.put_lock = Lock()
+        self.publish_lock = Lock()
+        self.last_published = None
+        self.threads = []
+        self.stopped = False
+        self.nqueued = self.npublished = self.ncoalesced = 0
+        self.ndropped = self.nerrors = self.max_depth = 0
+
+    @property
+    def cpt(self):
+        return self._cpt
+
+    @cpt.setter
+    def cpt(self, value):
+        if value is None:
+            self.stop()
+        else:
+            self.put(value)
+
+    def start(self):
+        "start worker threads"
+        self.stopped = False
+        self.last_published = None
+        for i in range(self.nworkers):
+            thread = Thread(target=self.work, name='scan_publisher_%d' % i)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, cpt):
+        "queue point for publishing, without blocking"
+        self._cpt = cpt
+        with self.put_lock:
+            # once stopped, the queue holds sentinels that must not be dropped
+            if self.stopped:
+                return
+            while True:
+                try:
+                    self.queue.put_nowait(cpt)
+                    break
+                except Full:
+                    try:
+                        self.queue.get_nowait()
+                        with self.lock:
+                            self.ndropped += 1
+                    except Empty:
+                        pass
+        with self.lock:
+            self.nqueued += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def work(self):
+        """worker loop: publish points from the queue, coalescing
+        all waiting points, until a sentinel (None) is taken"""
+        done = False
+        while not done:
+            cpt = self.queue.get()
+            if cpt is None:
+                return
+            ncoalesced = 0
+            while True:
+                try:
+                    later = self.queue.get_nowait()
+                except Empty:
+                    break
+                if later is None:
+                    done = True
+                    break
+                cpt = later
+                ncoalesced += 1
+            try:
+                with self.publish_lock:
+                    if (self.last_published is not None and
+                        cpt <= self.last_published):
+                        with self.lock:
+                            self.ncoalesced += ncoalesced + 1
+                        continue
+                    if callable(self.func):
+                        self.func(cpt=cpt, **self.func_kws)
+                    self.last_published = cpt
+                with self.lock:
+                    self.npublished += 1
+                    self.ncoalesced += ncoalesced
+            except Exception:
+                with self.lock:
+                    self.nerrors += 1
+                print("ScanPublisher: error publishing point %s: %s" %
+                      (cpt, sys.exc_info()[1]))
+
+    def stop(self):
+        "stop workers, after all queued points are published"
+        with self.put_lock:
+            if not self.stopped:
+                self.stopped = True
+                for thread in self.threads:
+                    self.queue.put(None)
+
+    def join(self, timeout=None):
+        "stop and wait for workers"
+        self.stop()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def get_stats(self):
+        "return dictionary of publishing statistics"
+        with self.lock:
+            return {'queued': self.nqueued, 'published': self.npublished,
+                    'coalesced': self.ncoalesced, 'dropped': self.ndropped,
+                    'errors': self.nerrors, 'queue_depth': self.queue.qsize(),
+                    'max_queue_depth': self.max_depth}
+
+class PointReader(object):
+    """Worker thread to read and record scan points, for pipelined scans.
+
+    Tasks are run in order, one at a time.  .wait() blocks until all
+    queued tasks are done, and re-raises any exception from a task,
+    so that errors are seen in the scan loop.
+    """
+    def __init__(self):
+        self.queue = Queue()
+        self.error = None
+        self.thread = None
+        self.nread = 0
+
+    def start(self):
+        "start worker thread"
+        self.thread = Thread(target=self.work, name='scan_point_reader')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, func, *args, **kws):
+        "queue a task"
+        self.queue.put((func, args, kws))
+
+    def work(self):
+        "worker loop: run tasks until a sentinel (None) is taken"
         while True:
-            poll(MIN_POLL_TIME, 0.25)
-            if self.cpt != last_point:
-                last_point =  self.cpt
-                t0 = time.time()
-                if self.cpt is not None and hasattr(self.func, '__call__'):
-                    self.func(cpt=self.cpt, **self.func_kws)
-            if self.cpt is None or time.time()-t0 > self.timeout:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                if self.error is None:
+                    func, args, kws = task
+                    func(*args, **kws)
+                    self.nread += 1
+            except Exception:
+                self.error = sys.exc_info()
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        "wait for queued tasks to finish, raising any error from them"
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            six.reraise(*error)
+
+    def stop(self):
+        "stop worker, after queued tasks are done"
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+class ScanInterrupts(object):
+    """Cached view of the abort / pause / resume requests in the scan database.
+
+    All three request flags are read with a single query, and at most
+    once per .poll_time seconds, so that checking for interrupts many
+    times per scan point does not hit the database each time.  The
+    .poll_time sets the upper bound on how stale the cached flags can be,
+    and so the latency for seeing an abort request.
+
+    For sqlite, the database 'data_version' is checked first, and the
+    flags are re-read only when another connection has written to the
+    database.
+
+    A change-notification source (database notify, Epics PV callback, ...)
+    can push new values with .notify(key, value), which take effect
+    immediately.  The .abort_event is set whenever an abort request
+    is seen, so that waits can be cut short.
+    """
+    keys = ('request_abort', 'request_pause', 'request_resume')
+    def __init__(self, scandb=None, poll_time=0.25, keys=None):
+        self.scandb = scandb
+        if keys is not None:
+            self.keys = tuple(keys)
+        self.poll_time = poll_time
+        self.values = dict([(key, False) for key in self.keys])
+        self.abort_event = Event()
+        self.last_read = 0
+        self.data_version = None
+
+    def _set_abort_event(self):
+        if self.values.get('request_abort', False):
+            self.abort_event.set()
+        else:
+            self.abort_event.clear()
+
+    def notify(self, key, value):
+        "push a new value for an interrupt request"
+        if not key.startswith('request_'):
+            key = 'request_%s' % key
+        if key in self.values:
+            self.values[key] = bool(int(value))
+        self._set_abort_event()
+
+    def clear(self):
+        "clear cached values, forcing a read at next update()"
+        for key in self.keys:
+            self.values[key] = False
+        self._set_abort_event()
+        self.last_read = 0
+        self.data_version = None
+
+    def update(self, force=False):
+        """update cached interrupt requests from database, if needed.
+        returns dictionary of {key: bool}"""
+        if self.scandb is None:
+            return self.values
+        now = time.time()
+        if not force and (now - self.last_read) < self.poll_time:
+            return self.values
+        self.last_read = now
+        version = self.scandb.get_data_version()
+        if (not force and version is not None and
+            version == self.data_version):
+            return self.values
+        self.data_version = version
+        self.values.update(self.scandb.get_info_many(self.keys, as_bool=True))
+        self._set_abort_event()
+        return self.values
+
+    def get(self, key):
+        "return cached value for an interrupt request"
+        if not key.startswith('request_'):
+            key = 'request_%s' % key
+        return self.values.get(key, False)
+
+class InfoBuffer(object):
+    """write-behind buffer for values in the info table.
+
+    Values set with .set() are held, with repeated keys coalesced, and
+    written all at once with ScanDB.set_info_many() at most .flush_time
+    seconds after being set: by the next .set() or, if there is none,
+    by a timer.  .flush() writes them at once (as at scan boundaries).
+    Values that fail to be written are kept, to be written later.
+    """
+    def __init__(self, scandb, flush_time=0.5):
+        self.scandb = scandb
+        self.flush_time = flush_time
+        self.pending = OrderedDict()
+        self.last_flush = time.time()
+        self.timer = None
+        self.lock = Lock()
+        self.flush_lock = Lock()
+
+    def set(self, key, value):
+        "set key / value, writing all pending values if flush_time has passed"
+        with self.lock:
+            self.pending[key] = value
+        if time.time() > self.last_flush + self.flush_time:
+            self.flush()
+        else:
+            self.start_timer()
+
+    def start_timer(self):
+        "start timer to flush pending values, if not already started"
+        with self.lock:
+            if self.timer is not None or len(self.pending) == 0:
                 return
+            wait = max(0.001, self.last_flush + self.flush_time - time.time())
+            self.timer = Timer(wait, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        "write all pending values"
+        with self.flush_lock:
+            with self.lock:
+                data, self.pending = self.pending, OrderedDict()
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            self.last_flush = time.time()
+            if len(data) > 0:
+                try:
+                    self.scandb.set_info_many(data)
+                except:
+                    logging.exception("could not write scan info")
+                    with self.lock:
+                        for key, val in self.pending.items():
+                            data[key] = val
+                        self.pending = data
+                    self.start_timer()
 
 class StepScan(object):
     """
@@ -160,6 +452,9 @@ class StepScan(object):
 
         self.pos_settle_time = MIN_POLL_TIME
         self.det_settle_time = MIN_POLL_TIME
+        # adaptive settling: positioners settle when their readbacks
+        # converge, with pos_settle_time as the maximum settle time
+        self.adaptive_settle = False
         self.pos_maxmove_time = 3600.0
         self.det_maxcount_time = 86400.0
         self.dwelltime = None
@@ -167,6 +462,9 @@ class StepScan(object):
         self.filename = filename
         self.auto_increment = auto_increment
         self.filetype = 'ASCII'
+        # counters with array values read one array at each point,
+        # (as for MCA spectra), rather than arrays for all points
+        self.array_counters_per_point = True
         self.scantype = 'linear'
         self.detmode  = 'scaler'
         self.scandb = scandb
@@ -176,6 +474,14 @@ class StepScan(object):
         self.verified = False
         self.abort = False
         self.pause = False
+        self.resume = False
+        # max time (in sec) between reads of interrupt requests from scandb
+        self.interrupt_poll_time = 0.25
+        self.interrupts = ScanInterrupts(scandb=scandb,
+                                         poll_time=self.interrupt_poll_time)
+        # min time (in sec) between writes of buffered scan info to scandb
+        self.info_flush_time = 0.5
+        self.info_buffer = None
         self.inittime = 0 # time to initialize scan (pre_scan, move to start, begin i/o)
         self.looptime = 0 # time to run scan loop (even if aborted)
         self.exittime = 0 # time to complete scan (post_scan, return positioners, complete i/o)
@@ -184,6 +490,13 @@ class StepScan(object):
         self.messenger = messenger or sys.stdout.write
         self.data_callback = data_callback
         self.publish_thread = None
+        self.publish_stats = {}
+        # per-point phase timing: enable with .profile or run(debug=True)
+        self.profile = False
+        self.phase_timer = PhaseTimer(enabled=False)
+        # pipelined mode: read and record each point in a worker thread,
+        # overlapped with the move to the next point
+        self.pipelined = False
 
         if filename is not None:
             self.datafile = self.open_output_file(filename=filename,
@@ -197,26 +510,65 @@ class StepScan(object):
         self.positioners = []
         self.triggers = []
         self.counters = []
+        self.counter_group = None
         self.detectors = []
 
         self.breakpoints = []
         self.at_break_methods = []
         self.pre_scan_methods = []
         self.post_scan_methods = []
+        self.datastore = None
         self.pos_actual  = []
+        self.scandata_published = {}
         self.dtimer = debugtime()
 
-    def set_info(self, attr, value):
-        """set scan info to _scan variable"""
+    @property
+    def pos_actual(self):
+        """actual positions: a view of the positioner columns of
+        .datastore if used, or a list of lists"""
+        if self.datastore is not None:
+            return self.datastore.get_data()[:, :len(self.positioners)]
+        return self._pos_actual
+
+    @pos_actual.setter
+    def pos_actual(self, value):
+        self.datastore = None
+        self._pos_actual = value
+
+    def set_info(self, attr, value, flush=False):
+        """set scan info to _scan variable
+
+        values are buffered and written to scandb at most every
+        .info_flush_time seconds, unless flush=True.  Interrupt
+        requests are always written immediately.
+        """
+        if attr in ScanInterrupts.keys:
+            self.interrupts.notify(attr, value)
+            flush = True
         if self.scandb is not None:
-            self.scandb.set_info(attr, value)
-            self.scandb.set_info('heartbeat', time.ctime())
+            if (self.info_buffer is None or
+                self.info_buffer.scandb is not self.scandb):
+                self.info_buffer = InfoBuffer(self.scandb,
+                                              flush_time=self.info_flush_time)
+            self.info_buffer.flush_time = self.info_flush_time
+            self.info_buffer.set(attr, value)
+            self.info_buffer.set('heartbeat', time.ctime())
+            if flush:
+                self.info_buffer.flush()
+
+    def flush_info(self):
+        """write all buffered scan info to scandb"""
+        if self.info_buffer is not None:
+            self.info_buffer.flush()
 
     def open_output_file(self, filename=None, comments=None):
-        """opens the output file"""
+        """opens the output file, depending on .filetype:
+        'ASCII', 'ASCII_STREAM' (written per point), or 'HDF5'"""
         creator = ASCIIScanFile
-        # if self.filetype == 'ASCII':
-        #     creator = ASCIIScanFile
+        if self.filetype.upper() in ('HDF5', 'NEXUS'):
+            creator = HDF5ScanFile
+        elif self.filetype.upper() in ('ASCII_STREAM', 'STREAM'):
+            creator = StreamingASCIIScanFile
         if filename is not None:
             self.filename = filename
         if comments is not None:
@@ -298,6 +650,7 @@ class StepScan(object):
         out = [m(breakpoint=breakpoint) for m in self.at_break_methods]
         if self.datafile is not None:
             self.datafile.write_data(breakpoint=breakpoint)
+        self.flush_info()
         if self.larch is not None:
             try:
                 self.larch.run("pre_scan_command()")
@@ -368,7 +721,7 @@ class StepScan(object):
                 self.larch.run("post_scan_command(row=%i)" % row)
             except:
                 self.write("Failed to run post_scan_command()\n")
-        self.set_info('scan_progress', 'finishing')
+        self.set_info('scan_progress', 'finishing', flush=True)
         return out
 
     def verify_scan(self):
@@ -407,8 +760,10 @@ class StepScan(object):
     def read_extra_pvs(self):
         "read values for extra PVs and 'extra_pvs' values from database"
         out = []
-        db_prefix = self.scandb.get_info('extra_pvs_prefix')
-        if len(db_prefix) > 0:
+        db_prefix = None
+        if self.scandb is not None:
+            db_prefix = self.scandb.get_info('extra_pvs_prefix')
+        if db_prefix is not None and len(db_prefix) > 0:
             prefix = fix_varname(db_prefix).title()
             for row in self.scandb.get_info(prefix=db_prefix, orderby='display_order'):
                 desc = prefix + '.' + fix_varname(row.notes.title())
@@ -418,8 +773,32 @@ class StepScan(object):
             out.append((desc, pv.pvname, pv.get(as_string=True)))
         return out
 
+    def read_point(self, cpt, positions=None, publish=False):
+        """read counters and record data for scan point cpt
+
+        positions: list of positioner readbacks (read now if None)
+        publish:   whether to queue point for publishing
+        """
+        self.counter_group.read()
+        if positions is None:
+            positions = [p.current() for p in self.positioners]
+        if self.datastore is not None:
+            self.datastore.set_row(positions)
+            self.datastore.next_row()
+        else:
+            self.pos_actual.append(positions)
+        self.datafile.write_point()
+        if publish and self.publish_thread is not None:
+            self.publish_thread.put(cpt)
+
     def clear_data(self):
         """clear scan data"""
+        if self.datastore is not None:
+            self.datastore.clear()
+            for c in self.counters:
+                if getattr(c, 'point_arrays', None):
+                    c.point_arrays = []
+            return
         for c in self.counters:
             c.clear()
         self.pos_actual = []
@@ -452,24 +831,59 @@ class StepScan(object):
             self.data_callback(scan=self, cpt=cpt, npts=npts, **kws)
 
     def set_all_scandata(self):
+        """publish counter data to scandb, appending only the points
+        added since the last publish.  A counter buffer that has been
+        replaced (not appended to) since the last publish is rewritten.
+
+        Points are marked as published only once written, so that points
+        of a failed write are written again by the next publish.
+        """
+        if self.scandb is None:
+            return
         self.publishing_scandata = True
-        if self.scandb is not None:
+        try:
+            # without the scandatachunks table, whole arrays are rewritten
+            use_chunks = getattr(self.scandb, 'has_chunks', True)
+            chunks, appended = [], {}
             for c in self.counters:
                 name = getattr(c, 'db_label', None)
                 if name is None:
                     name = c.label
                 c.db_label = fix_varname(name)
-                self.scandb.set_scandata(c.db_label, c.buff)
-        self.publishing_scandata = False
+                buff = c.buff
+                npts = len(buff)
+                # for counters using a data store, the buffer is a new
+                # view each time, so track the store and its generation
+                store = getattr(c, 'store', None)
+                last_token, last_npts = self.scandata_published.get(c.db_label,
+                                                                    (None, 0))
+                if store is not None:
+                    token = (store, store.generation)
+                    changed = last_token != token
+                else:
+                    token = buff
+                    changed = last_token is not token
+                if changed or npts < last_npts or (npts > last_npts and
+                                                   not use_chunks):
+                    self.scandb.set_scandata(c.db_label, buff)
+                    self.scandata_published[c.db_label] = (token, npts)
+                elif npts > last_npts:
+                    chunks.append((c.db_label, last_npts, buff[last_npts:npts]))
+                    appended[c.db_label] = (token, npts)
+            self.scandb.append_scandata_chunks(chunks)
+            self.scandata_published.update(appended)
+        finally:
+            self.publishing_scandata = False
 
     def init_scandata(self):
+        self.scandata_published = {}
         if self.scandb is None:
             return
 
         self.scandb.clear_scandata()
-        self.scandb.commit()
         time.sleep(0.05)
         names = []
+        rows = []
         npts = len(self.positioners[0].array)
         for p in self.positioners:
             try:
@@ -481,9 +895,9 @@ class StepScan(object):
             if name in names:
                 name += '_2'
             if name not in names:
-                self.scandb.add_scandata(name, p.array.tolist(),
-                                         pvname=p.pv.pvname,
-                                         units=units, notes='positioner')
+                rows.append({'name': name, 'value': p.array.tolist(),
+                             'pvname': p.pv.pvname, 'units': units,
+                             'notes': 'positioner'})
                 names.append(name)
         for c in self.counters:
             units = getattr(c, 'units', None)
@@ -500,11 +914,10 @@ class StepScan(object):
             if name in names:
                 name += '_2'
             if name not in names:
-                self.scandb.add_scandata(name, [],
-                                         pvname=pvname,
-                                         units=units, notes='counter')
+                rows.append({'name': name, 'value': [], 'pvname': pvname,
+                             'units': units, 'notes': 'counter'})
                 names.append(name)
-        self.scandb.commit()
+        self.scandb.add_scandata_many(rows)
 
     def set_error(self, msg):
         """set scan error message"""
@@ -516,17 +929,82 @@ class StepScan(object):
             return self.scandb.get_info(key, as_bool=True)
         return False
 
-    def look_for_interrupts(self):
+    def look_for_interrupts(self, force=False):
         """set interrupt requests:
 
         abort / pause / resume
-        if scandb is being used, these are looked up from database.
+        if scandb is being used, these are looked up from database,
+        at most every .interrupt_poll_time seconds unless force=True.
         """
-        self.abort  = self.get_infobool('request_abort')
-        self.pause  = self.get_infobool('request_pause')
-        self.resume = self.get_infobool('request_resume')
+        self.interrupts.scandb = self.scandb
+        self.interrupts.poll_time = self.interrupt_poll_time
+        vals = self.interrupts.update(force=force)
+        self.abort  = vals['request_abort']
+        self.pause  = vals['request_pause']
+        self.resume = vals['request_resume']
         return self.abort
 
+    def save_phase_timing(self):
+        """save summary of per-point phase times to scandb info
+        'scan_phase_timing' (as JSON), and to JSON and CSV files
+        alongside the data file"""
+        self.set_info('scan_phase_timing',
+                      json.dumps(self.phase_timer.get_summary()))
+        base = os.path.splitext(self.datafile.filename)[0]
+        try:
+            self.phase_timer.save_json('%s_timing.json' % base)
+            self.phase_timer.save_csv('%s_timing.csv' % base)
+        except IOError:
+            self.write("could not write phase timing files for %s\n" % base)
+
+    def settle_positioners(self):
+        """wait for positioner readbacks to settle, for at most
+        .pos_settle_time seconds in total"""
+        t0 = time.time()
+        for p in self.positioners:
+            p.settle(max(MIN_POLL_TIME, self.pos_settle_time - (time.time()-t0)))
+
+    def save_settle_stats(self):
+        """save positioner settling statistics to scandb info
+        'pos_settle_stats' (as JSON), keyed by PV name.  Statistics for
+        positioners not in this scan are kept."""
+        if self.scandb is None:
+            return
+        try:
+            stats = json.loads(self.scandb.get_info('pos_settle_stats',
+                                                    default='{}'))
+        except ValueError:
+            stats = {}
+        for p in self.positioners:
+            pstats = p.get_settle_stats()
+            if pstats['npts'] > 0:
+                pstats['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                stats[p.pv.pvname] = pstats
+        self.scandb.set_info('pos_settle_stats', json.dumps(stats))
+
+    def wait_for_events(self, events, timeout=None):
+        """wait until all events (threading.Events) are set, an abort
+        is requested, or timeout (in sec) expires.
+
+        Waiting wakes as soon as each event is set, and checks for
+        interrupts every .interrupt_poll_time seconds.
+        returns whether all events were set.
+        """
+        t0 = time.time()
+        abort_event = self.interrupts.abort_event
+        for event in events:
+            while not event.is_set():
+                wait_time = self.interrupt_poll_time
+                if timeout is not None:
+                    wait_time = min(wait_time, t0 + timeout - time.time())
+                    if wait_time <= 0:
+                        return False
+                if event.wait(wait_time):
+                    break
+                if abort_event.is_set() or self.look_for_interrupts():
+                    return False
+        return True
+
     def write(self, msg):
         self.messenger(msg)
 
@@ -541,6 +1019,7 @@ class StepScan(object):
         self.set_info('request_abort', 0)
         self.set_info('request_pause', 0)
         self.set_info('request_resume', 0)
+        self.interrupts.clear()
 
 
     def prepare_scan(self):
@@ -609,7 +1088,7 @@ class StepScan(object):
             self.set_info('request_abort', 0)
             self.set_info('scan_time_estimate', time_est)
             self.set_info('scan_total_points', npts)
-            self.set_info('scan_current_point', 0)
+            self.set_info('scan_current_point', 0, flush=True)
             self.scandb.set_filename(self.filename)
 
         self.dtimer.add('PRE: wrote data 0')
@@ -626,6 +1105,13 @@ class StepScan(object):
         for d in self.counters:
             d.read()
             d.clear()
+        self.counter_group = CounterGroup(self.counters)
+        self.datastore = None
+        if all([hasattr(c, 'attach_store') for c in self.counters]):
+            npos = len(self.positioners)
+            self.datastore = ScanDataStore(npts, npos + len(self.counters))
+            for icol, c in enumerate(self.counters):
+                c.attach_store(self.datastore, npos + icol)
         self.dtimer.add('PRE: start scan')
 
 
@@ -651,6 +1137,19 @@ class StepScan(object):
         self.prepare_scan()
         ts_init = time.time()
         self.inittime = ts_init - ts_start
+        for trig in self.triggers:
+            trig.clear_stats()
+        if self.adaptive_settle:
+            for p in self.positioners:
+                p.clear_settle_stats()
+                if p.get_readback() is None:
+                    self.write("no readback for settling %s\n" % p.pv.pvname)
+        ptimer = self.phase_timer = PhaseTimer(self.npts,
+                                               enabled=(self.profile or debug))
+        reader = None
+        if self.pipelined:
+            reader = PointReader()
+            reader.start()
 
         i = -1
         while not self.abort:
@@ -660,48 +1159,51 @@ class StepScan(object):
             try:
                 point_ok = True
                 self.cpt = i+1
+                ptimer.start_point(i)
                 self.look_for_interrupts()
-                self.dtimer.add('Pt %i : looked for interrupts' % i)
                 while self.pause:
-                    time.sleep(0.25)
+                    self.interrupts.abort_event.wait(0.25)
                     if self.look_for_interrupts():
                         break
+                ptimer.mark('interrupts')
                 # set dwelltime
                 if self.dwelltime_varys:
                     for d in self.detectors:
                         d.set_dwelltime(self.dwelltime[i])
                 # move to next position
                 [p.move_to_pos(i) for p in self.positioners]
-                self.dtimer.add('Pt %i : move_to_pos (%i)' % (i, len(self.positioners)))
 
                 self.set_info('scan_current_point', i)
 
-                # move positioners
-                t0 = time.time()
-                while (not all([p.done for p in self.positioners]) and
-                       time.time() - t0 < self.pos_maxmove_time):
-                    if self.look_for_interrupts():
-                        break
-                    poll(MIN_POLL_TIME, 0.25)
-                self.dtimer.add('Pt %i : pos done' % i)
-                poll(self.pos_settle_time, 0.25)
-                self.dtimer.add('Pt %i : pos settled' % i)
+                # wait for positioners
+                self.wait_for_events([p.done_event for p in self.positioners],
+                                     timeout=self.pos_maxmove_time)
+                ptimer.mark('move')
+                if self.adaptive_settle:
+                    self.settle_positioners()
+                else:
+                    poll(self.pos_settle_time, 0.25)
+                ptimer.mark('settle')
+
+                # previous point must be read before triggering again
+                if reader is not None:
+                    reader.wait()
+                    ptimer.mark('read')
 
                 # trigger detectors
-                [trig.start() for trig in self.triggers]
-                self.dtimer.add('Pt %i : triggers fired, (%d)' % (i, len(self.triggers)))
+                dtime = self.min_dwelltime
+                if self.dwelltime_varys:
+                    dtime = self.dwelltime[i]
+                t0 = time.time()
+                [trig.start(expected=dtime) for trig in self.triggers]
+                ptimer.mark('trigger')
 
                 # wait for detectors
-                t0 = time.time()
-                time.sleep(max(0.05, self.min_dwelltime/2.0))
-                while not all([trig.done for trig in self.triggers]):
-                    if (time.time() - t0) > 5.0*(1 + 2*self.max_dwelltime):
-                        break
-                    poll(MIN_POLL_TIME, 0.5)
-                self.dtimer.add('Pt %i : triggers done' % i)
+                self.wait_for_events([trig.done_event for trig in self.triggers],
+                                     timeout=5.0*(1 + 2*self.max_dwelltime))
                 if self.look_for_interrupts():
                     break
-                point_ok = (all([trig.done for trig in self.triggers]) and
+                point_ok = (all([trig.wait(0) for trig in self.triggers]) and
                             time.time()-t0 > (0.75*self.min_dwelltime))
                 if not point_ok:
                     point_ok = True
@@ -713,42 +1215,58 @@ class StepScan(object):
                         if not point_ok:
                             print('Trigger problem?:', trig, trig.runtime, self.min_dwelltime)
                             trig.abort()
+                ptimer.mark('wait')
 
                 # read counters and actual positions
                 poll(self.det_settle_time, 0.1)
-                self.dtimer.add('Pt %i : det settled done.' % i)
-                [c.read() for c in self.counters]
-                # self.dtimer.add('Pt %i : read counters' % i)
-
-                self.pos_actual.append([p.current() for p in self.positioners])
-                if self.publish_thread is not None:
-                    self.publish_thread.cpt = self.cpt
-                # self.dtimer.add('Pt %i : sent message' % i)
+                ptimer.mark('settle')
+                if reader is not None:
+                    # positions are read now, before the next move starts
+                    positions = [p.current() for p in self.positioners]
+                    reader.put(self.read_point, self.cpt, positions,
+                               publish=True)
+                else:
+                    self.read_point(self.cpt)
+                    ptimer.mark('read')
+                    if self.publish_thread is not None:
+                        self.publish_thread.put(self.cpt)
+                ptimer.mark('publish')
 
                 # if this is a breakpoint, execute those functions
                 if i in self.breakpoints:
+                    if reader is not None:
+                        reader.wait()
                     self.at_break(breakpoint=i, clear=True)
-                # self.dtimer.add('Pt %i: done.' % i)
+                ptimer.mark('breakpoint')
                 self.look_for_interrupts()
+                ptimer.mark('interrupts')
 
             except KeyboardInterrupt:
                 self.set_info('request_abort', 1)
                 self.abort = True
             if not point_ok:
                 self.write('point messed up.  Will try again\n')
+                if reader is not None:
+                    reader.wait()
                 time.sleep(0.25)
                 for trig in self.triggers:
                     trig.abort()
                 for det in self.detectors:
                     det.pre_scan(scan=self)
                 i -= 1
-
-            self.dtimer.add('Pt %i: completely done.' % i)
+                ptimer.mark('wait')
 
         # scan complete
         # return to original positions, write data
+        if reader is not None:
+            reader.stop()
+            reader.wait()
         self.dtimer.add('Post scan start')
         self.set_all_scandata()
+        if ptimer.enabled:
+            self.save_phase_timing()
+        if self.adaptive_settle:
+            self.save_settle_stats()
 
         ts_loop = time.time()
         self.looptime = ts_loop - ts_init
@@ -758,8 +1276,14 @@ class StepScan(object):
         self.dtimer.add('Post: return move issued')
         self.datafile.write_data(breakpoint=-1, close_file=True, clear=False)
         self.dtimer.add('Post: file written')
-        if self.look_for_interrupts():
+        if self.look_for_interrupts(force=True):
             self.write("scan aborted at point %i of %i\n" % (self.cpt, self.npts))
+        for trig in self.triggers:
+            stats = trig.get_stats()
+            if stats['noverruns'] > 0:
+                self.write("%s: %i overruns in %i triggers (mean=%.3f, max=%.3f sec)\n" %
+                           (trig, stats['noverruns'], stats['nstarts'],
+                            stats['mean'], stats['max']))
 
         # run post_scan methods
         out = self.post_scan()
@@ -769,11 +1293,12 @@ class StepScan(object):
 
         # end data thread
         if self.publish_thread is not None:
-            self.publish_thread.cpt = None
             self.publish_thread.join()
+            self.publish_stats = self.publish_thread.get_stats()
 
         self.set_info('scan_progress',
-                      'scan complete. Wrote %s' % self.datafile.filename)
+                      'scan complete. Wrote %s' % self.datafile.filename,
+                      flush=True)
         ts_exit = time.time()
         self.exittime = ts_exit - ts_loop
         self.runtime  = ts_exit - ts_start
@@ -781,4 +1306,5 @@ class StepScan(object):
 
         if debug:
             self.dtimer.show()
+            print(ptimer.get_report())
         return self.datafile.filename
@@ -9,26 +9,34 @@ import os
 import sys
 import json
 import time
+import select as _select
+import struct
 import atexit
 import logging
 import numpy as np
 from socket import gethostname
+from threading import Lock
 from datetime import datetime
 import yaml
+import six
 # from utils import backup_versions, save_backup
 import sqlalchemy
-from sqlalchemy import MetaData, Table, select, and_, create_engine, text
-from sqlalchemy.orm import sessionmaker, mapper, clear_mappers
+from sqlalchemy import (MetaData, Table, select, and_, create_engine, text,
+                        bindparam)
+from sqlalchemy.util import LRUCache
+from sqlalchemy.orm import sessionmaker, scoped_session, mapper, clear_mappers
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import  NoResultFound
 
 # needed for py2exe?
-from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.dialects import sqlite, postgresql, mysql
 
 import epics
 
-from .scandb_schema import get_dbengine, create_scandb, map_scandb
+from .scandb_schema import (get_dbengine, create_scandb, map_scandb,
+                            upgrade_scandb, needs_upgrade,
+                            get_schema_version, SCHEMA_VERSION)
 from .scandb_schema import (Info, Status, PV, MonitorValues, ExtraPVs,
                             Macros, Commands, ScanData, ScanPositioners,
                             ScanCounters, ScanDetectors, ScanDefs,
@@ -54,10 +62,42 @@ def get_credentials(envvar='ESCAN_CREDENTIALS'):
 
 def json_encode(val):
     "simple wrapper around json.dumps"
-    if val is None or isinstance(val, (str, unicode)):
+    if val is None or isinstance(val, six.string_types):
         return val
     return  json.dumps(val)
 
+# postgres notification channel for changes to the commands queue
+COMMAND_CHANNEL = 'scandb_commands'
+
+# binary array encoding for scandata: a header of
+#    ARRAY_MAGIC, dtype code ('d' for <f8, 'i' for <i4), ndim, shape
+# followed by the little-endian array data
+ARRAY_MAGIC = b'EPSA'
+ARRAY_DTYPES = {b'd': '<f8', b'i': '<i4'}
+
+def encode_binary_array(value):
+    """encode array as bytes: header with dtype and shape, and
+    little-endian float64 or int32 data"""
+    arr = np.asarray(value)
+    code = b'd'
+    if (arr.dtype.kind in 'iub' and arr.size > 0 and
+        arr.min() >= -2**31 and arr.max() < 2**31):
+        code = b'i'
+    arr = arr.astype(ARRAY_DTYPES[code])
+    header = struct.pack('<4scB', ARRAY_MAGIC, code, arr.ndim)
+    header += struct.pack('<%iI' % arr.ndim, *arr.shape)
+    return header + arr.tobytes()
+
+def decode_binary_array(buff):
+    "decode bytes from encode_binary_array to a (read-only) numpy array"
+    magic, code, ndim = struct.unpack('<4scB', buff[:6])
+    if magic != ARRAY_MAGIC:
+        raise ValueError('not an encoded binary array')
+    offset = 6 + 4*ndim
+    shape = struct.unpack('<%iI' % ndim, buff[6:offset])
+    return np.frombuffer(buff, dtype=ARRAY_DTYPES[code],
+                         offset=offset).reshape(shape)
+
 def isotime2datetime(isotime):
     "convert isotime string to datetime object"
     sdate, stime = isotime.replace('T', ' ').split(' ')
@@ -148,6 +188,47 @@ def save_sqlite(filename, dbname=None, server='postgresql', **kws):
     sdb.commit()
     print(" Wrote %s " % filename)
 
+def info_upsert(table, server='sqlite'):
+    """return an insert statement for the info table that updates
+    'value' and 'modify_time' for existing keys, or None if the
+    database dialect does not support an upsert.
+    """
+    try:
+        if server.startswith('sqlite'):
+            stmt = sqlite.insert(table)
+            return stmt.on_conflict_do_update(index_elements=['key'],
+                      set_={'value': stmt.excluded.value,
+                            'modify_time': stmt.excluded.modify_time})
+        elif server.startswith('p'):
+            stmt = postgresql.insert(table)
+            return stmt.on_conflict_do_update(index_elements=['key'],
+                      set_={'value': stmt.excluded.value,
+                            'modify_time': stmt.excluded.modify_time})
+        elif server.startswith('my'):
+            stmt = mysql.insert(table)
+            return stmt.on_duplicate_key_update(value=stmt.inserted.value,
+                                 modify_time=stmt.inserted.modify_time)
+    except AttributeError:  # older sqlalchemy
+        pass
+    return None
+
+class ScanDataArray(object):
+    """scandata row, with data decoded to an array, as from ScanDB.get_scandata
+
+    data holds the values for points start, start+1, ....
+    """
+    attrs = ('id', 'name', 'notes', 'pvname', 'units', 'breakpoints',
+             'commands_id', 'modify_time')
+    def __init__(self, row, data, start=0):
+        for attr in self.attrs:
+            setattr(self, attr, getattr(row, attr, None))
+        self.data = data
+        self.start = start
+
+    def __repr__(self):
+        return "<ScanDataArray(%s, start=%i, npts=%i)>" % (self.name, self.start,
+                                                           len(self.data))
+
 class ScanDB(object):
     """
     Main Interface to Scans Database
@@ -160,10 +241,22 @@ class ScanDB(object):
         self.tables = None
         self.engine = None
         self.session = None
-        self.conn    = None
         self.metadata = None
+        self._version_conn = None
+        self._version_lock = Lock()
+        self._listen_conn = None
+        self._cmd_version = None
+        self._cmd_notify = None
+        self._status_snapshots = {}
+        self._scandata_cache = {}
+        self._mapped = {}
+        self._stmts = {}
+        self._executor = None
+        self.has_chunks = True
+        self.has_bindata = True
         self.pvs = {}
         self.scandata = []
+        self.scandata_codec = 'json'
         self.restoring_pvs = []
         if dbname is None:
             conndict = get_credentials(envvar='ESCAN_CREDENTIALS')
@@ -210,7 +303,7 @@ class ScanDB(object):
         time.sleep(0.1)
 
     def isScanDB(self, dbname, server='sqlite',
-                 user='', password='', host='', port=None):
+                 user='', password='', host='', port=None, **kws):
         """test if a file is a valid scan database:
         must be a sqlite db file, with tables named
         'postioners', 'detectors', and 'scans'
@@ -232,7 +325,7 @@ class ScanDB(object):
         _tables = ('info', 'status', 'commands', 'pv', 'scandefs')
         engine = get_dbengine(dbname, server=server, create=False,
                               user=user, password=password,
-                              host=host, port=port)
+                              host=host, port=port, **kws)
         try:
             meta = MetaData(engine)
             meta.reflect()
@@ -252,10 +345,22 @@ class ScanDB(object):
         return allfound
 
     def connect(self, dbname, server='sqlite', create=False,
-                user='', password='', host='', port=None, **kws):
-        "connect to an existing database"
+                user='', password='', host='', port=None,
+                pool_size=5, max_overflow=10, upgrade=False, **kws):
+        """connect to an existing database
+
+        .session is a scoped session, giving each thread its own
+        session, with connections taken from a pool of pool_size
+        connections (plus up to max_overflow more).
+
+        With upgrade=True (as used by the scan server), a database with
+        an older schema version is upgraded.  Otherwise, the schema is
+        not changed: scan data is then read and written without the
+        newer 'scandatachunks' table (see .has_chunks).
+        """
         creds = dict(user=user, password=password, host=host,
-                     port=port, server=server)
+                     port=port, server=server, pool_size=pool_size,
+                     max_overflow=max_overflow)
         self.dbname = dbname
         if not self.isScanDB(dbname,  **creds) and create:
             engine, meta = create_scandb(dbname, create=True, **creds)
@@ -266,12 +371,26 @@ class ScanDB(object):
         if self.engine is None:
             raise ValueError("Cannot use '%s' as a Scan Database!" % dbname)
 
-        self.conn   = self.engine.connect()
-        self.session = sessionmaker(bind=self.engine, autocommit=True)()
+        if needs_upgrade(self.metadata):
+            if upgrade:
+                upgrade_scandb(self.metadata, server=self.server)
+            else:
+                print("ScanDB schema version %s is older than %s: run the scan server to upgrade" %
+                      (get_schema_version(self.metadata), SCHEMA_VERSION))
+        self.has_chunks = 'scandatachunks' in self.metadata.tables
+        self.has_bindata = 'bindata' in self.metadata.tables['scandata'].c
+        self.session = scoped_session(sessionmaker(bind=self.engine,
+                                                   autocommit=True))
 
         tabs, classes, mapprops, mapkeys = map_scandb(self.metadata)
         self.tables, self.classes = tabs, classes
         self.mapprops, self.mapkeys = mapprops, mapkeys
+        self._mapped = {}
+        self.prepare_statements()
+
+        self.scandata_codec = self.get_info_many(['scandata_codec'])['scandata_codec']
+        if self.scandata_codec is None:
+            self.scandata_codec = 'json'
 
         self.status_codes = {}
         self.status_names = {}
@@ -284,13 +403,26 @@ class ScanDB(object):
         "commit session state -- null op since using autocommit"
         self.session.flush()
 
+    @property
+    def conn(self):
+        """for executing statements: each statement uses a
+        pooled connection, so this is safe to use from any thread"""
+        return self.engine
+
     def close(self):
         "close session"
         try:
             self.set_hostpid(clear=True)
             self.session.flush()
-            self.session.close()
-            self.conn.close()
+            self.session.remove()
+            with self._version_lock:
+                if self._version_conn is not None:
+                    self._version_conn.close()
+                    self._version_conn = None
+            if self._listen_conn is not None:
+                self._listen_conn.close()
+                self._listen_conn = None
+            self.engine.dispose()
         except:
             logging.exception("could not close session")
 
@@ -315,14 +447,43 @@ class ScanDB(object):
 
     def get_table(self, tablename):
         "return (self.tables, self.classes) for a table name"
+        if tablename in self._mapped:
+            return self._mapped[tablename]
         cls   = self.classes[tablename]
         table = self.tables[tablename]
         attr  = self.mapkeys[tablename]
         props = self.mapprops[tablename]
         if not hasattr(cls , attr):
             mapper(cls, table, props)
+        self._mapped[tablename] = (cls, table)
         return cls, table
 
+    def prepare_statements(self):
+        """build bound-parameter statements for frequently called
+        methods, run with execute_stmt() using a compiled statement cache.
+        Bound parameters for where clauses are prefixed with 'b_'."""
+        info = self.tables['info']
+        cmds = self.tables['commands']
+        sdata = self.tables['scandata']
+        self._stmts = {
+            'info_get': info.select().where(info.c.key==bindparam('b_key')),
+            'info_insert': info.insert(),
+            'info_update': info.update().where(info.c.key==bindparam('b_key')),
+            'info_status': select([info.c.key, info.c.value]).where(
+                info.c.key.in_(bindparam('b_keys', expanding=True))),
+            'command_get': select([cmds.c.status_id]).where(cmds.c.id==bindparam('b_id')),
+            'command_update': cmds.update().where(cmds.c.id==bindparam('b_id')),
+            'scandata_update': sdata.update().where(sdata.c.name==bindparam('b_name'))}
+        if self.has_chunks:
+            chunks = self.tables['scandatachunks']
+            self._stmts['chunks_delete'] = chunks.delete().where(
+                chunks.c.name==bindparam('b_name'))
+        self._executor = self.engine.execution_options(compiled_cache=LRUCache(256))
+
+    def execute_stmt(self, stmt, **params):
+        """execute a prepared statement by name, with parameters"""
+        return self._executor.execute(self._stmts[stmt], **params)
+
     def getall(self, tablename, orderby=None):
         """return objects for all rows from a named table
          orderby   to order results
@@ -370,12 +531,14 @@ class ScanDB(object):
         if key is None:
             return q.all()
 
-        vals = q.filter(cls.key==key).all()
+        vals = self.execute_stmt('info_get', b_key=key).fetchall()
         thisrow = None_or_one(vals, errmsg % key)
         if thisrow is None:
             out = default
-            data = {'key': key, 'value': default}
-            table.insert().execute(**data)
+            try:
+                self.execute_stmt('info_insert', key=key, value=default)
+            except IntegrityError:
+                pass
         else:
             out = thisrow.value
 
@@ -389,6 +552,68 @@ class ScanDB(object):
             out = thisrow
         return out
 
+    def get_info_many(self, keys, as_bool=False):
+        """get values for several keys of the info table with a single query,
+        returning a dictionary of {key: value}.  Missing keys are
+        returned as None (or False with as_bool), and are not added
+        """
+        cls, table = self.get_table('info')
+        out = dict([(key, None) for key in keys])
+        for row in self.query(table).filter(cls.key.in_(list(keys))).all():
+            out[row.key] = row.value
+        if as_bool:
+            for key, val in out.items():
+                if val is None: val = 0
+                out[key] = bool(int(val))
+        return out
+
+    def get_data_version(self):
+        """return a counter that changes when the database has been
+        modified by another connection, or None if not supported.
+
+        For sqlite, this is 'PRAGMA data_version', read on a connection
+        kept for this purpose, as the value is per-connection.
+        """
+        if not self.server.startswith('sqlite'):
+            return None
+        try:
+            with self._version_lock:
+                if self._version_conn is None:
+                    self._version_conn = self.engine.connect()
+                return self._version_conn.execute(text('PRAGMA data_version')).scalar()
+        except:
+            return None
+
+    def get_status_snapshot(self, keys, since_version=None):
+        """return (version, values) for several info keys, read together.
+
+        version is a counter that increases when the values may have
+        changed: for sqlite, the 'data_version' (see get_data_version),
+        otherwise a count, kept by this ScanDB, of changes seen in the
+        values for these keys.
+
+        If since_version is given and nothing has changed since then,
+        values is None (and for sqlite, no query is made).  Otherwise
+        values is a dictionary of {key: value}, with None for missing keys.
+        """
+        keys = tuple(keys)
+        version = self.get_data_version()
+        if version is not None:
+            if since_version is not None and version == since_version:
+                return version, None
+            return version, self.get_info_many(keys)
+
+        values = dict([(key, None) for key in keys])
+        for row in self.execute_stmt('info_status', b_keys=list(keys)).fetchall():
+            values[row.key] = row.value
+        version, last = self._status_snapshots.get(keys, (0, None))
+        if values != last:
+            version += 1
+            self._status_snapshots[keys] = (version, values)
+        if since_version is not None and version == since_version:
+            return version, None
+        return version, values
+
     def set_config(self, name, text):
         """add configuration, general purpose table"""
         cls, table = self.get_table('config')
@@ -445,18 +670,73 @@ class ScanDB(object):
 
     def set_info(self, key, value, notes=None):
         """set key / value in the info table"""
-        cls, table = self.get_table('info')
-        vals  = self.query(table).filter(cls.key==key).all()
-        data = {'key': key, 'value': value}
+        data = {'value': value}
         if notes is not None:
             data['notes'] = notes
-        if len(vals) < 1:
-            table = table.insert()
-        else:
-            table = table.update(whereclause=text("key='%s'" % key))
-        table.execute(**data)
+        if self.execute_stmt('info_update', b_key=key, **data).rowcount < 1:
+            try:
+                self.execute_stmt('info_insert', key=key, **data)
+            except IntegrityError:
+                self.execute_stmt('info_update', b_key=key, **data)
         self.commit()
 
+    def set_info_quiet(self, key, value):
+        """set key / value in the info table, without this ScanDB seeing
+        the write as a change (see get_data_version), as for the scan
+        server heartbeat, so that its own periodic writes do not wake
+        wait_for_commands() or ScanInterrupts.  Other clients see the
+        change as for set_info().
+
+        For sqlite, the value is written on the connection used to read
+        'data_version', as writes on that connection do not change it.
+        """
+        if self.server.startswith('sqlite'):
+            stmt = self._stmts['info_update']
+            with self._version_lock:
+                if self._version_conn is None:
+                    self._version_conn = self.engine.connect()
+                if self._version_conn.execute(stmt, b_key=key,
+                                              value=value).rowcount > 0:
+                    return
+        self.set_info(key, value)
+
+    def set_info_many(self, data):
+        """set several key / value pairs in the info table, with all
+        changes written in a single transaction.
+
+        data is a dictionary of {key: value}.  An upsert is used when the
+        database dialect supports one.  On error, the transaction is
+        rolled back and the exception raised.
+        """
+        if len(data) < 1:
+            return
+        cls, table = self.get_table('info')
+        now = datetime.now()
+        rows = [{'key': key, 'value': val, 'modify_time': now}
+                for key, val in data.items()]
+        upsert = info_upsert(table, server=self.server)
+        conn = self.engine.connect()
+        trans = conn.begin()
+        try:
+            if upsert is not None:
+                conn.execute(upsert, rows)
+            else:
+                query = select([table.c.key]).where(table.c.key.in_(list(data.keys())))
+                known = [row.key for row in conn.execute(query).fetchall()]
+                inserts = [r for r in rows if r['key'] not in known]
+                for row in rows:
+                    if row['key'] in known:
+                        conn.execute(table.update().where(table.c.key==row['key']),
+                                     value=row['value'], modify_time=now)
+                if len(inserts) > 0:
+                    conn.execute(table.insert(), inserts)
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
+
     def clobber_all_info(self):
         """dangerous!!!! clear all info --
         can leave a DB completely broken and unusable
@@ -532,9 +812,8 @@ class ScanDB(object):
         """update a named table with dicts for 'where' and 'vals'"""
         if table in self.tables:
             table = self.tables[table]
-        constraints = ["%s=%s" % (str(k), repr(v)) for k, v in where.items()]
-        whereclause = ' AND '.join(constraints)
-        table.update(whereclause=text(whereclause)).execute(**vals)
+        constraints = [table.c[k]==v for k, v in where.items()]
+        table.update().where(and_(*constraints)).execute(**vals)
         self.commit()
 
     def getrow(self, table, name, one_or_none=False):
@@ -556,7 +835,7 @@ class ScanDB(object):
 
     def rename_scandef(self, scanid, name):
         cls, table = self.get_table('scandefs')
-        table.update(whereclause=text("id='%d'" % scanid)).execute(name=name)
+        table.update().where(table.c.id==scanid).execute(name=name)
 
     def del_scandef(self, name=None, scanid=None):
         """delete scan defn by name"""
@@ -633,58 +912,220 @@ class ScanDB(object):
     ## scan data
     ## note that this is supported differently for Postgres and Sqlite:
     ##    With Postgres, data arrays are held internally,
-    ##    With Sqlite, data is held as json-ified arrays
-    def get_scandata(self, **kws):
-        return self.select('scandata', orderby='id', **kws)
+    ##    With Sqlite, data is held as json-ified arrays, or, if the info
+    ##    'scandata_codec' is 'binary', as binary arrays in 'bindata'.
+    ##
+    ## The 'scandata' table holds one row per positioner/counter, and
+    ## the 'scandatachunks' table holds chunks of points appended to
+    ## these arrays since the data in 'scandata' was last set, so that
+    ## publishing new points does not require rewriting whole arrays.
+    ##
+    ## All encoding and decoding of arrays goes through encode_array()
+    ## and decode_array().
+    def encode_array(self, value):
+        """encode array for storage in scandata tables,
+        returning dictionary of {column: value}"""
+        if not self.has_bindata:
+            return {'data': self._encode_data(value)}
+        if self.server.startswith('sqli') and self.scandata_codec == 'binary':
+            return {'data': None, 'bindata': encode_binary_array(value)}
+        return {'data': self._encode_data(value), 'bindata': None}
+
+    def _encode_data(self, value):
+        "encode array for the 'data' column"
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif isinstance(value, tuple):
+            value = list(value)
+        if isinstance(value, (int, float)):
+            value = [value]
+        if self.server.startswith('sqli'):
+            value = json_encode(value)
+        return value
+
+    def decode_array(self, row):
+        """decode array from a row of the scandata tables
+        to a numpy array"""
+        bindata = getattr(row, 'bindata', None)
+        if bindata is not None:
+            return decode_binary_array(bindata)
+        value = row.data
+        if value is None:
+            return np.array([])
+        if isinstance(value, six.string_types):
+            value = json.loads(value.replace('{', '[').replace('}', ']'))
+        return np.asarray(value, dtype=np.float64)
+
+    def get_scandata(self, since=None, **kws):
+        """return list of scandata arrays (ScanDataArray objects)
+        in order of creation, with data decoded to numpy arrays.
+
+        with since=N, the data holds only points N and higher.
+
+        Decoded arrays are cached by row id and modify_time, so that
+        data for unchanged rows is neither read nor decoded again.
+        """
+        cls, table = self.get_table('scandata')
+        query = select([c for c in table.c if c.name not in ('data', 'bindata')])
+        for key, val in kws.items():
+            if key in table.c:
+                query = query.where(table.c[key]==val)
+        rows = query.order_by(table.c.id).execute().fetchall()
+
+        cache = self._scandata_cache
+        if len(kws) == 0:
+            for rowid in set(cache.keys()) - set([row.id for row in rows]):
+                cache.pop(rowid, None)
+        mtimes = dict([(row.id, row.modify_time) for row in rows
+                       if (row.modify_time is None or
+                           cache.get(row.id, (None, None))[0] != row.modify_time)])
+        if len(mtimes) > 0:
+            dquery = select([c for c in table.c if c.name in ('id', 'data', 'bindata')])
+            for drow in dquery.where(table.c.id.in_(list(mtimes.keys()))).execute().fetchall():
+                cache[drow.id] = (mtimes[drow.id], self.decode_array(drow))
+
+        chunks = {}
+        if self.has_chunks:
+            cls, ctab = self.get_table('scandatachunks')
+            query = ctab.select().order_by(ctab.c.id)
+            if since is not None:
+                query = query.where(ctab.c.start + ctab.c.npts > since)
+            for chunk in query.execute().fetchall():
+                if chunk.name not in chunks:
+                    chunks[chunk.name] = []
+                chunks[chunk.name].append(chunk)
+
+        if since is None:
+            since = 0
+        out = []
+        for row in rows:
+            data = cache[row.id][1]
+            for chunk in chunks.get(row.name, []):
+                cdata = self.decode_array(chunk)
+                if chunk.start > len(data):
+                    gap = np.nan*np.ones((chunk.start-len(data),) + cdata.shape[1:])
+                    cdata = np.concatenate((gap, cdata))
+                data = np.concatenate((data[:chunk.start], cdata))
+            out.append(ScanDataArray(row, np.array(data[since:]), start=since))
+        return out
 
     def add_scandata(self, name, value, notes='', pvname='', **kws):
         cls, table = self.get_table('scandata')
         name = name.strip()
-        kws.update({'notes': notes, 'pvname': pvname})
-        if self.server.startswith('sqli'):
-            value = json_encode(value)
-        row = self.__addRow(cls, ('name', 'data'), (name, value), **kws)
+        kws.update({'notes': notes, 'pvname': pvname,
+                    'modify_time': datetime.now()})
+        kws.update(self.encode_array(value))
+        row = self.__addRow(cls, ('name',), (name,), **kws)
         self.session.add(row)
         self.commit()
         return row
 
+    def add_scandata_many(self, rows):
+        """add several scandata arrays, all inserted in a single transaction.
+
+        rows is a list of dictionaries with keys 'name' and 'value', and
+        optionally 'notes', 'pvname', and 'units'.
+        """
+        if len(rows) < 1:
+            return
+        cls, table = self.get_table('scandata')
+        data = []
+        now = datetime.now()
+        for row in rows:
+            drow = {'name': row['name'].strip(),
+                    'notes': row.get('notes', ''),
+                    'pvname': row.get('pvname', ''),
+                    'units': row.get('units', ''),
+                    'modify_time': now}
+            drow.update(self.encode_array(row.get('value', [])))
+            data.append(drow)
+        conn = self.engine.connect()
+        trans = conn.begin()
+        try:
+            conn.execute(table.insert(), data)
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
+
     def set_scandata(self, name, value,  **kws):
-        cls, tab = self.get_table('scandata')
-        if isinstance(value, np.ndarray):
-            value = value.tolist()
-        elif isinstance(value, tuple):
-            val = list(value)
-        if isinstance(value, (int, float)):
-            value = [value]
-        where = "name='%s'" % name
-        update = tab.update().where(whereclause=text(where))
-        if self.server.startswith('sqli'):
-            update.execute(data=json_encode(value))
-        else:
-            update.values({tab.c.data: value}).execute()
-        # self.commit()
+        """set full data array for a named scandata row,
+        removing any appended chunks, in a single transaction"""
+        conn = self._executor.connect()
+        trans = conn.begin()
+        try:
+            conn.execute(self._stmts['scandata_update'], b_name=name,
+                         modify_time=datetime.now(), **self.encode_array(value))
+            if self.has_chunks:
+                conn.execute(self._stmts['chunks_delete'], b_name=name)
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def append_scandata_chunks(self, chunks):
+        """append chunks of new points to scandata arrays,
+        all inserted in a single transaction.
+
+        chunks is a list of (name, start, values) with start
+        the index of the first point in values.
+        This requires the 'scandatachunks' table (see .has_chunks).
+        """
+        if len(chunks) < 1:
+            return
+        if not self.has_chunks:
+            raise ValueError("ScanDB has no scandatachunks table: upgrade needed")
+        cls, ctab = self.get_table('scandatachunks')
+        rows = []
+        for name, start, values in chunks:
+            row = {'name': name, 'start': start, 'npts': len(values)}
+            row.update(self.encode_array(values))
+            rows.append(row)
+        conn = self.engine.connect()
+        trans = conn.begin()
+        try:
+            conn.execute(ctab.insert(), rows)
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
 
     def append_scandata(self, name, val):
         cls, tab = self.get_table('scandata')
-        where = "name='%s'" % name
-        tselect = tab.select(whereclause=text(where))
-        tupdate = tab.update().where(whereclause=text(where))
+        tselect = tab.select().where(tab.c.name==name)
+        tupdate = tab.update().where(tab.c.name==name)
         if self.server.startswith('sqli'):
-            data = json.loads(tselect.execute().fetchone().data)
+            data = self.decode_array(tselect.execute().fetchone()).tolist()
             data.append(val)
-            tupdate.execute(data=json_encode(data))
+            tupdate.execute(modify_time=datetime.now(), **self.encode_array(data))
         else:
             n = len(tselect.execute().fetchone().data)
-            tupdate.values({tab.c.data[n]: val}).execute()
+            tupdate.values({tab.c.data[n]: val,
+                            tab.c.modify_time: datetime.now()}).execute()
         self.commit()
 
     def clear_scandata(self, **kws):
+        """clear all scandata arrays and chunks, in a single transaction"""
         cls, table = self.get_table('scandata')
-        a = self.get_scandata()
-        if len(a) < 0:
-            return
-        self.session.execute(table.delete().where(table.c.id != 0))
-        self.commit()
+        conn = self.engine.connect()
+        trans = conn.begin()
+        try:
+            if self.has_chunks:
+                cls, ctab = self.get_table('scandatachunks')
+                conn.execute(ctab.delete())
+            conn.execute(table.delete())
+            trans.commit()
+        except:
+            trans.rollback()
+            raise
+        finally:
+            conn.close()
 
     ### positioners
     def get_positioners(self, **kws):
@@ -881,9 +1322,8 @@ class ScanDB(object):
         if len(vals) < 1:
             table.insert().execute(name=name, notes=notes, is_monitor=ismon)
         elif notes is not '':
-            where = "name='%s'" % name
-            table.update(whereclause=text(where)).execute(notes=notes,
-                                                    is_monitor=ismon)
+            table.update().where(table.c.name==name).execute(notes=notes,
+                                                             is_monitor=ismon)
         thispv = self.query(table).filter(cls.name == name).one()
         self.connect_pvs(names=[name])
         return thispv
@@ -1008,8 +1448,82 @@ class ScanDB(object):
             setattr(this, key, val)
 
         self.session.add(this)
+        self.session.flush()
+        self.notify_commands()
         return this
 
+    def notify_commands(self):
+        """signal that the queue of commands has changed, waking any
+        wait_for_commands(): the 'command_notify' info value is set to
+        a new value and, for postgres, a NOTIFY is sent"""
+        self.set_info('command_notify', '%.6f:%d' % (time.time(), os.getpid()))
+        if self.server.startswith('p'):
+            try:
+                # NOTIFY is sent only on commit
+                with self.engine.begin() as conn:
+                    conn.execute(text("NOTIFY %s" % COMMAND_CHANNEL))
+            except:
+                logging.exception("could not send command notification")
+
+    def _listen_commands(self):
+        """connection listening for postgres command notifications"""
+        if self._listen_conn is None:
+            conn = self.engine.raw_connection()
+            conn.connection.set_isolation_level(0)  # autocommit
+            cursor = conn.cursor()
+            cursor.execute("LISTEN %s" % COMMAND_CHANNEL)
+            cursor.close()
+            self._listen_conn = conn
+        return self._listen_conn.connection
+
+    def wait_for_commands(self, last=None, timeout=1.0, poll_time=0.02):
+        """wait for the queue of commands to change, as signaled by
+        notify_commands(), for at most timeout seconds.
+
+        last is the value returned by a previous call.  Returns the
+        current 'command_notify' value, which differs from last if
+        commands have changed.
+
+        For postgres, this blocks on LISTEN, and the info table is read
+        only when a notification arrives.  For sqlite, the cheap
+        'data_version' is checked every poll_time seconds, and the info
+        table read only after a write.  Otherwise, the info table is read
+        every poll_time seconds.
+        """
+        t0 = time.time()
+        if self.server.startswith('p'):
+            # listen before the first read, so no notification is missed
+            conn = self._listen_commands()
+            if self._cmd_notify is None:
+                self._cmd_notify = self.get_info_many(['command_notify'])['command_notify']
+            current = self._cmd_notify
+            while current == last and time.time() - t0 < timeout:
+                wait = max(0, timeout - (time.time() - t0))
+                if _select.select([conn], [], [], wait) == ([], [], []):
+                    break
+                conn.poll()
+                if len(conn.notifies) > 0:
+                    del conn.notifies[:]
+                    current = self.get_info_many(['command_notify'])['command_notify']
+                    self._cmd_notify = current
+            return current
+
+        version = self.get_data_version()
+        if version is None or version != self._cmd_version:
+            self._cmd_notify = self.get_info_many(['command_notify'])['command_notify']
+        self._cmd_version = version
+        current = self._cmd_notify
+        while current == last and time.time() - t0 < timeout:
+            time.sleep(poll_time)
+            if version is not None:
+                newversion = self.get_data_version()
+                if newversion == version:
+                    continue
+                version = self._cmd_version = newversion
+            current = self.get_info_many(['command_notify'])['command_notify']
+            self._cmd_notify = current
+        return current
+
     def get_current_command_id(self):
         """return id of current command"""
         cmdid  = self.get_info('current_command_id', default=0)
@@ -1028,8 +1542,7 @@ class ScanDB(object):
         "get status for a command by id"
         if cmdid is None:
             cmdid = self.get_current_command_id()
-        cls, table = self.get_table('commands')
-        ret = table.select().where(table.c.id==cmdid).execute().fetchone()
+        ret = self.execute_stmt('command_get', b_id=cmdid).fetchone()
         return self.status_names[ret.status_id]
 
     def set_command_status(self, status, cmdid=None):
@@ -1037,21 +1550,21 @@ class ScanDB(object):
         if cmdid is None:
             cmdid = self.get_current_command_id()
 
-        cls, table = self.get_table('commands')
         status = status.lower()
         if status not in self.status_codes:
             status = 'unknown'
 
         statid = self.status_codes[status]
-        thiscmd = table.update(whereclause=text("id='%i'" % cmdid))
-        thiscmd.execute(status_id=statid)
         if status.startswith('start'):
-            thiscmd.execute(start_time=datetime.now())
+            self.execute_stmt('command_update', b_id=cmdid, status_id=statid,
+                         start_time=datetime.now())
+        else:
+            self.execute_stmt('command_update', b_id=cmdid, status_id=statid)
 
     def set_command_run_order(self, run_order, cmdid):
         """set the run_order of a command (by id)"""
-        cls, table = self.get_table('commands')
-        table.update(whereclause=text("id='%i'" % cmdid)).execute(run_order=run_order)
+        self.execute_stmt('command_update', b_id=cmdid, run_order=run_order)
+        self.notify_commands()
 
     def set_filename(self, filename):
         """set filename for info and command"""
@@ -1063,31 +1576,25 @@ class ScanDB(object):
         """set filename for command"""
         if cmdid is None:
             cmdid  = self.get_current_command_id()
-        cls, table = self.get_table('commands')
-        table.update(whereclause=text("id='%i'" % cmdid)).execute(output_file=filename)
+        self.execute_stmt('command_update', b_id=cmdid, output_file=filename)
 
     def set_command_output(self, value=None, cmdid=None):
         """set the status of a command (by id)"""
         if cmdid is None:
             cmdid  = self.get_current_command_id()
-        cls, table = self.get_table('commands')
-        table.update(whereclause=text("id='%i'" % cmdid)).execute(output_value=repr(value))
+        self.execute_stmt('command_update', b_id=cmdid, output_value=repr(value))
 
     def replace_command(self, cmdid, new_command):
         """replace requested  command"""
         cls, table = self.get_table('commands')
         row = table.select().where(table.c.id==cmdid).execute().fetchone()
         if self.status_names[row.status_id].lower() == 'requested':
-            table.update(whereclause=text("id='%i'" % cmdid)).execute(command=new_command)
+            self.execute_stmt('command_update', b_id=cmdid, command=new_command)
         
 
     def cancel_command(self, cmdid):
         """cancel command"""
         self.set_command_status('canceled', cmdid)
-        cls, table = self.get_table('commands')
-        canceled  = self.status_codes['canceled']
-        table.update(whereclause=text("id='%d'" % cmdid)
-        ).execute(status_id=canceled)
 
 
     def cancel_remaining_commands(self):
@@ -1098,8 +1605,7 @@ class ScanDB(object):
         for r in table.select().where(table.c.status_id==requested
                                       ).order_by(cls.run_order
                                       ).execute().fetchall():
-            table.update(whereclause=text("id='%d'" % r.id)
-            ).execute(status_id=canceled)
+            self.execute_stmt('command_update', b_id=r.id, status_id=canceled)
 
     def test_abort(self, msg='scan abort'):
         """look for abort, raise ScanDBAbort if set"""
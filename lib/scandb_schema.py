@@ -11,15 +11,15 @@ import logging
 
 # from utils import backup_versions, save_backup
 
-from sqlalchemy import (MetaData, and_, create_engine, text, func,
+from sqlalchemy import (MetaData, and_, create_engine, text, func, event,
                         Table, Column, ColumnDefault, ForeignKey,
                         Integer, Float, String, Text, DateTime,
-                        UniqueConstraint)
+                        LargeBinary, UniqueConstraint, Index)
 
 from sqlalchemy.orm import sessionmaker, mapper, relationship
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.pool import SingletonThreadPool
+from sqlalchemy.pool import QueuePool, StaticPool
 
 # needed for py2exe?
 from sqlalchemy.dialects import sqlite, mysql, postgresql
@@ -28,6 +28,10 @@ from sqlalchemy.dialects import sqlite, mysql, postgresql
 CMD_STATUS = ('unknown', 'requested', 'canceled', 'starting', 'running',
                'aborting', 'stopping', 'aborted', 'finished')
 
+## version of database schema, stored as info 'version':
+## databases with an older version are changed by upgrade_scandb()
+SCHEMA_VERSION = '2.2'
+
 PV_TYPES = (('numeric', 'Numeric Value'),
             ('enum',  'Enumeration Value'),
             ('string',  'String Value'),
@@ -56,18 +60,48 @@ def hasdb_pg(dbname, create=False,
     conn.close()
     return dbname in dbs
 
+## pragmas set on each new sqlite connection
+SQLITE_PRAGMAS = (('journal_mode', 'WAL'),
+                  ('synchronous', 'NORMAL'),
+                  ('busy_timeout', 30000))
+
+def set_sqlite_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    """set pragmas for every new connection of a sqlite engine"""
+    def on_connect(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas:
+            cursor.execute("PRAGMA %s=%s" % (name, value))
+        cursor.close()
+    event.listen(engine, 'connect', on_connect)
+
 def get_dbengine(dbname, server='sqlite', create=False,
-                user='', password='',  host='', port=None):
-    """create databse engine"""
+                user='', password='',  host='', port=None,
+                pool_size=5, max_overflow=10):
+    """create databse engine
+
+    connections are pooled, and may be used from any thread.  pool_size
+    and max_overflow set the number of connections held open, and the
+    number of extra connections allowed when all are in use.
+    sqlite connections use WAL journaling (see SQLITE_PRAGMAS).
+    """
+    pool_kws = dict(poolclass=QueuePool, pool_size=pool_size,
+                    max_overflow=max_overflow)
     if server == 'sqlite':
-        return create_engine('sqlite:///%s' % (dbname),
-                             poolclass=SingletonThreadPool)
+        if dbname == ':memory:':
+            pool_kws = dict(poolclass=StaticPool)
+        engine = create_engine('sqlite:///%s' % (dbname),
+                               connect_args={'check_same_thread': False,
+                                             'timeout': 30},
+                               **pool_kws)
+        set_sqlite_pragmas(engine)
+        return engine
     elif server == 'mysql':
         conn_str= 'mysql+mysqldb://%s:%s@%s:%i/%s'
         if port is None:
             port = 3306
         port = int(port)
-        return create_engine(conn_str % (user, password, host, port, dbname))
+        return create_engine(conn_str % (user, password, host, port, dbname),
+                             pool_pre_ping=True, **pool_kws)
 
     elif server.startswith('p'):
         conn_str= 'postgresql://%s:%s@%s:%i/%s'
@@ -76,7 +110,8 @@ def get_dbengine(dbname, server='sqlite', create=False,
         port = int(port)
         hasdb = hasdb_pg(dbname, create=create, user=user, password=password,
                          host=host, port=port)
-        return create_engine(conn_str % (user, password, host, port, dbname))
+        return create_engine(conn_str % (user, password, host, port, dbname),
+                             pool_pre_ping=True, **pool_kws)
 
 def IntCol(name, **kws):
     return Column(name, Integer, **kws)
@@ -87,6 +122,9 @@ def ArrayCol(name,  server='sqlite', **kws):
         ArrayType = postgresql.ARRAY(Float)
     return Column(name, ArrayType, **kws)
 
+def BinaryCol(name, **kws):
+    return Column(name, LargeBinary, **kws)
+
 def StrCol(name, size=None, **kws):
     val = Text
     if size is not None:
@@ -199,7 +237,11 @@ class Commands(_BaseTable):
         return "<%s(%s)>" % (name, ', '.join(fields))
 
 class ScanData(_BaseTable):
-    notes, pvname, data, units, breakpoints, modify_time = [None]*6
+    notes, pvname, data, bindata, units, breakpoints, modify_time = [None]*7
+
+class ScanDataChunks(_BaseTable):
+    "chunks of points appended to scandata arrays"
+    name, start, npts, data, bindata, modify_time = [None]*6
 
 class SlewScanStatus(_BaseTable):
     text, modify_time = None, None
@@ -243,6 +285,73 @@ class Instrument_Postcommands(_BaseTable):
     "instrument postcommand table"
     name, notes = None, None
 
+def ScanDataChunksTable(metadata, server='sqlite'):
+    """table of chunks of points appended to the named scandata arrays:
+    each row holds npts values for points start .. start+npts-1
+    """
+    return Table('scandatachunks', metadata,
+                 Column('id', Integer, primary_key=True),
+                 StrCol('name', size=512, nullable=False, index=True),
+                 IntCol('start', default=0),
+                 IntCol('npts', default=0),
+                 ArrayCol('data', server=server),
+                 BinaryCol('bindata'),
+                 Column('modify_time', DateTime, default=datetime.now))
+
+def version_tuple(version):
+    "version string to tuple of ints for comparison, ('2.1' -> (2, 1))"
+    out = []
+    for word in str(version).split('.'):
+        try:
+            out.append(int(word))
+        except ValueError:
+            break
+    return tuple(out)
+
+def get_schema_version(metadata):
+    "return schema version stored in info table"
+    info = metadata.tables['info']
+    row = info.select().where(info.c.key=='version').execute().fetchone()
+    return '0' if row is None else row.value
+
+def needs_upgrade(metadata):
+    "return whether the schema is older than SCHEMA_VERSION"
+    return (version_tuple(get_schema_version(metadata)) <
+            version_tuple(SCHEMA_VERSION))
+
+def upgrade_scandb(metadata, server='sqlite'):
+    """add tables and columns that may be missing from a database
+    created with an older version of create_scandb, and set the
+    stored schema version to SCHEMA_VERSION.
+
+    This changes the database schema, and so should be run only by
+    the scan server or as an explicit upgrade step, not by every client.
+    Returns whether the database was upgraded."""
+    if not needs_upgrade(metadata):
+        return False
+    if 'scandatachunks' not in metadata.tables:
+        ScanDataChunksTable(metadata, server=server).create()
+    chunks = metadata.tables['scandatachunks']
+    if not any([list(ix.columns.keys()) == ['name'] for ix in chunks.indexes]):
+        Index('ix_scandatachunks_name', chunks.c.name).create(metadata.bind)
+
+    bintype = 'BLOB'
+    if server.startswith('p'):
+        bintype = 'BYTEA'
+    elif server.startswith('my'):
+        bintype = 'LONGBLOB'
+    for tname in ('scandata', 'scandatachunks'):
+        table = metadata.tables[tname]
+        if 'bindata' not in table.columns:
+            metadata.bind.execute(text("ALTER TABLE %s ADD COLUMN bindata %s" %
+                                       (tname, bintype)))
+            table.append_column(BinaryCol('bindata'))
+
+    info = metadata.tables['info']
+    info.update().where(info.c.key=='version').execute(value=SCHEMA_VERSION,
+                                                       modify_time=datetime.now())
+    return True
+
 def create_scandb(dbname, server='sqlite', create=True, **kws):
     """Create a ScanDB:
 
@@ -343,10 +452,13 @@ def create_scandb(dbname, server='sqlite', create=True, **kws):
     scandata = NamedTable('scandata', metadata, with_pv=True,
                          cols = [PointerCol('commands'),
                                  ArrayCol('data', server=server),
+                                 BinaryCol('bindata'),
                                  StrCol('units', default=''),
                                  StrCol('breakpoints', default=''),
                                  Column('modify_time', DateTime)])
 
+    scandatachunks = ScanDataChunksTable(metadata, server=server)
+
     slewscanstatus = Table('slewscanstatus', metadata,
                            Column('id', Integer, primary_key=True),
                            StrCol('text'),
@@ -400,7 +512,7 @@ def create_scandb(dbname, server='sqlite', create=True, **kws):
     for name, notes in PV_TYPES:
         pvtype.insert().execute(name=name, notes=notes)
 
-    for key, value in (("version", "2.0"),
+    for key, value in (("version", SCHEMA_VERSION),
                        ("user_name", ""),
                        ("experiment_id",  ""),
                        ("user_folder",    ""),
@@ -426,13 +538,16 @@ def map_scandb(metadata):
     map_props = {}
     keyattrs = {}
     for cls in (Info, Messages, Config, Status, PV, PVType, MonitorValues,
-                Macros, ExtraPVs, Commands, ScanData, ScanPositioners,
+                Macros, ExtraPVs, Commands, ScanData, ScanDataChunks,
+                ScanPositioners,
                 ScanCounters, ScanDetectors, ScanDetectorConfig, ScanDefs,
                 SlewScanPositioners, SlewScanStatus, Common_Commands,
                 Position, Position_PV, Instrument, Instrument_PV,
                 Instrument_Precommands, Instrument_Postcommands):
 
         name = cls.__name__.lower()
+        if name not in tables:  # as for a database not yet upgraded
+            continue
         props = {}
         if name == 'commands':
             props = {'status': relationship(Status)}
@@ -475,14 +590,18 @@ def map_scandb(metadata):
     keyattrs['monitovalues'] = 'id'
     keyattrs['messages'] = 'id'
     keyattrs['slewscanstatus'] = 'id'
+    keyattrs['scandatachunks'] = 'id'
 
     # set onupdate and default constraints for several datetime columns
     # note use of ColumnDefault to wrap onpudate/default func
     fnow = ColumnDefault(datetime.now)
 
     for tname in ('info', 'messages', 'commands', 'position','scandefs',
-                  'scandata', 'slewscanstatus', 'scandetectorconfig',
+                  'scandata', 'scandatachunks', 'slewscanstatus',
+                  'scandetectorconfig',
                   'monitorvalues', 'commands'):
+        if tname not in tables:
+            continue
         tables[tname].columns['modify_time'].onupdate =  fnow
         tables[tname].columns['modify_time'].default =  fnow
 
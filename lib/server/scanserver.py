@@ -9,6 +9,7 @@ import glob
 import epics
 
 from ..scandb import ScanDB, make_datetime
+from ..scan import ScanInterrupts
 from ..file_utils import fix_varname, nativepath
 from ..utils import (strip_quotes, plain_ascii, tstamp,
                      ScanDBException, ScanDBAbort)
@@ -39,7 +40,10 @@ class ScanServer():
 
     def connect(self, dbname, **kws):
         """connect to Scan Database"""
-        self.scandb = ScanDB(dbname=dbname, **kws)
+        self.scandb = ScanDB(dbname=dbname, upgrade=True, **kws)
+        self.interrupts = ScanInterrupts(scandb=self.scandb, poll_time=0.1,
+                                         keys=('request_abort', 'request_pause',
+                                               'request_shutdown'))
 
         self.set_scan_message('Server Initializing')
         self.scandb.set_hostpid()
@@ -208,10 +212,10 @@ class ScanServer():
 
     def look_for_interrupts(self):
         """look for aborts"""
-        get_info = self.scandb.get_info
-        self.req_abort = get_info('request_abort', as_bool=True)
-        self.req_pause = get_info('request_pause', as_bool=True)
-        self.req_shutdown = get_info('request_shutdown', as_bool=True)
+        vals = self.interrupts.update()
+        self.req_abort = vals['request_abort']
+        self.req_pause = vals['request_pause']
+        self.req_shutdown = vals['request_shutdown']
         return self.req_abort
 
     def clear_interrupts(self):
@@ -223,6 +227,7 @@ class ScanServer():
         self.req_abort = self.req_pause = False
         self.scandb.set_info('request_abort', 0)
         self.scandb.set_info('request_pause', 0)
+        self.interrupts.clear()
 
     def mainloop(self):
         if self.larch is None:
@@ -241,11 +246,20 @@ class ScanServer():
         cmd_query = cmd_table.select().where(
             cmd_table.c.status_id==request_id).order_by(cmd_cls.run_order)
 
-        # Note: this loop is really just looking for new commands
-        # or interrupts, so does not need to go super fast.
+        # this loop blocks waiting for the commands queue to change
+        # (see ScanDB.notify_commands), and re-reads the queue only after
+        # a change, while commands remain, or every cmd_check_time seconds
+        # for commands added without a notification.
+        cmd_check_time = 5.0
+        cmd_notify = None
+        check_commands = True
+        last_check = 0
         while True:
-            epics.poll(0.025, 1.0)
-            time.sleep(0.25)
+            epics.poll(0.001, 1.0)
+            notify = self.scandb.wait_for_commands(cmd_notify, timeout=0.25)
+            if notify != cmd_notify:
+                cmd_notify = notify
+                check_commands = True
             now = time.time()
             self.look_for_interrupts()
 
@@ -257,7 +271,7 @@ class ScanServer():
             # update server heartbeat / message
             if now > msgtime + 0.75:
                 msgtime = now
-                self.scandb.set_info('heartbeat', tstamp())
+                self.scandb.set_info_quiet('heartbeat', tstamp())
                 if self.epicsdb is not None:
                     self.epicsdb.setTime()
             # if pauses, continue loop
@@ -266,7 +280,11 @@ class ScanServer():
                 continue
 
             # get ordered list of requested commands
-            reqs = cmd_query.execute().fetchall()
+            reqs = []
+            if check_commands or now > last_check + cmd_check_time:
+                reqs = cmd_query.execute().fetchall()
+                last_check = now
+                check_commands = len(reqs) > 0
 
             # abort command?
             if (self.req_abort or (self.epicsdb is not None
@@ -284,8 +302,6 @@ class ScanServer():
             # do next command
             if len(reqs) > 0:
                 self.do_command(reqs[0])
-            else:
-                time.sleep(0.5)
         # mainloop end
         self.finish()
         return None
@@ -7,16 +7,17 @@ import os
 import json
 import shutil
 import time
-from threading import Thread
+from threading import Thread, Event
 import numpy as np
 
-from .scan import StepScan
+from .scan import StepScan, PointReader
 from .positioner import Positioner
 from .saveable import Saveable
 
 from .utils import ScanDBAbort
 from .detectors import Struck, TetrAMM, Xspress3
-from .detectors import (Counter, Trigger, AreaDetector, write_poni)
+from .detectors import (Counter, Trigger, AreaDetector, DetectorGroup,
+                         write_poni)
 from .file_utils import fix_varname, fix_filename, increment_filename
 
 from epics import PV, poll, get_pv, caget, caput
@@ -39,6 +40,9 @@ class Slew_Scan(StepScan):
         self.detmode  = 'ndarray'
         self.motor_vals = {}
         self.orig_positions = {}
+        self.det_latency = []
+        # times to retry arming and starting detectors that are not ready
+        self.det_ready_retries = 1
 
     def prepare_scan(self):
         """prepare slew scan"""
@@ -259,6 +263,7 @@ class Slew_Scan(StepScan):
                 det.config_filesaver(path=detpath)
             except AttributeError:
                 pass
+        self.flush_info()
         return sname
 
     def post_scan(self):
@@ -269,8 +274,8 @@ class Slew_Scan(StepScan):
         for m in self.post_scan_methods:
             m()
 
+        DetectorGroup(self.detectors).stop()
         for det in self.detectors:
-            det.stop()
             det.disarm(mode=self.detmode)
             det.ContinuousMode()
             if isinstance(det, AreaDetector):
@@ -376,42 +381,75 @@ class Slew_Scan(StepScan):
                 xrddet = det
             det.NDArrayMode(numframes=npulses)
 
-        # put detectors in order for arm/start
-        # this allows arming and starting times to be parallelized
-        # also, initially arm detectors
-
-        det_arm_delay = det_start_delay = 0.05
+        # detectors are armed and started in parallel, waiting on
+        # readbacks: put the slowest (xrd, xrf) first
         ordered_dets = []
         if xrddet is not None:
             ordered_dets.append(xrddet)
         if xrfdet is not None:
             ordered_dets.append(xrfdet)
         for det in self.detectors:
-            # det.arm(mode='ndarray', numframes=npulses, fnum=0, wait=False)
-            det_arm_delay = max(det_arm_delay, det.arm_delay)
-            det_start_delay = max(det_start_delay, det.start_delay)
             if det not in ordered_dets:
                 ordered_dets.append(det)
+        detgroup = DetectorGroup(ordered_dets)
+        self.det_latency = []
 
         self.clear_interrupts()
         self.set_info('scan_progress', 'starting')
         self.scandb.set_filename(self.filename)
         mappref = self.scandb.get_info('epics_map_prefix')
-        rowdata_ok = True
         start_time = time.time()
-        irow = 0
         if mappref is not None:
             caput('%sstatus' % (mappref), 'Collecting')
         dtimer =  debugtime()
         self.scandb.set_info('repeated_map_rows', '')
         repeated_rows = []
-        while irow < npts:
+
+        # pipelined rows: data for each row is saved and checked by the
+        # row saver thread while the next row is collected.
+        pipelined = (self.pipelined or
+                     self.scandb.get_info('slew_pipelined_rows', as_bool=True))
+        redo_at_end = self.scandb.get_info('slew_redo_rows',
+                                           default='immediate') == 'end'
+        self.rowdets = (scadet, xrfdet, xrddet)
+        self.row_saver = None
+        if pipelined:
+            self.row_saver = PointReader()
+            self.row_saver.start()
+            self.rows_failed = []
+            self.master_rows = {}
+            self.next_master_row = 1
+            self.dets_released = Event()
+            self.dets_released.set()
+
+        rows = list(range(1, npts+1))
+        rows_acquired = set()
+        pos_reader_thread = None
+        while True:
+            if self.row_saver is not None:
+                if len(rows) == 0:
+                    self.row_saver.wait()
+                failed = []
+                while len(self.rows_failed) > 0:
+                    failed.append(self.rows_failed.pop(0))
+                if redo_at_end:
+                    rows.extend(failed)
+                else:
+                    rows[:0] = failed
+            if len(rows) == 0:
+                break
             if self.look_for_interrupts():
                 if mappref is not None:
                     caput('%sstatus' % (mappref), 'Aborting')
                 break
 
-            irow += 1
+            irow = rows.pop(0)
+            redo = irow in rows_acquired
+            rows_acquired.add(irow)
+            if redo:
+                repeated_rows.append(irow)
+                self.scandb.set_info('repeated_map_rows',
+                                     ', '.join(['%i' % r for r in repeated_rows]))
             dtimer.add('=== row start %i ====' % irow)
             self.set_info('scan_progress', 'row %i of %i' % (irow, npts))
             if mappref is not None:
@@ -431,33 +469,53 @@ class Slew_Scan(StepScan):
                         self.larch.run("pre_scan_command(row=%i, npts=%i)" % (irow, npts))
                     except:
                         print("Failed to run pre_scan_command(row=%i)" % irow)
-                    self.set_info('prescan_lasttime', "%i" % int(now))
+                    self.set_info('prescan_lasttime', "%i" % int(now), flush=True)
 
             for pv, v1, v2 in self.motor_vals.values():
                 val = v1
                 if trajname == 'backward': val = v2
                 pv.put(val, wait=False)
 
-            lastrow_ok = rowdata_ok
-            rowdata_ok = True
-
             dtimer.add('inner pos move started irow=%i' % irow)
-            txd0 = time.time()
-            for det in ordered_dets:
-                det.arm(mode='ndarray', numframes=npulses, fnum=irow, wait=False)
-                # print("arm det=%s %.3f" % (det.label, time.time()-txd0), irow, npulses)
-            time.sleep(det_arm_delay)
-
-            dtimer.add('detectors armed %.3f' % det_arm_delay)
+            if self.row_saver is not None:
+                if not self.wait_row_detectors():
+                    if mappref is not None:
+                        caput('%sstatus' % (mappref), 'Aborting')
+                    break
+                dtimer.add('previous row detectors released')
+            # arm and start detectors, trying again if any are not
+            # ready: if they are still not ready, the row is marked bad
+            for ntry in range(self.det_ready_retries + 1):
+                start_times = {}
+                not_ready = detgroup.arm(mode='ndarray', numframes=npulses,
+                                         fnum=irow, wait=False)
+                arm_times = detgroup.latency
+                dtimer.add('detectors armed')
+                if len(not_ready) == 0:
+                    not_ready = detgroup.start(arm=False, wait=False)
+                    start_times = detgroup.latency
+                    dtimer.add('detectors started')
+                if len(not_ready) == 0:
+                    break
+                print("Row %i: detectors not ready: %s" % (irow, ', '.join(not_ready)))
+                detgroup.stop()
+            dets_ok = len(not_ready) == 0
+            latency = {}
             for det in ordered_dets:
-                det.start(arm=False, wait=False)
-                # print("start det=%s %.3f" % (det.label, time.time()-txd0))
-            time.sleep(det_start_delay)
-            # print("det delays ", det_arm_delay, det_start_delay)
-
-            dtimer.add('detectors started  %.3f' % det_start_delay)
+                latency[det.label] = {'arm': arm_times.get(det.label),
+                                      'start': start_times.get(det.label)}
+            self.det_latency.append({'row': irow, 'latency': latency,
+                                     'ntries': ntry+1})
+            if debug:
+                print("# Row %i detector arm/start times: %s" % (irow,
+                      ', '.join(['%s=%s/%s' % (label, repr(t['arm']), repr(t['start']))
+                                 for label, t in latency.items()])))
+            # XPS gathering data for the previous row must be read
+            # before the next trajectory is armed
+            if pos_reader_thread is not None:
+                pos_reader_thread.join(timeout=30)
             self.xps.arm_trajectory(trajname)
-            if irow < 2 or not lastrow_ok:
+            if irow < 2 or redo:
                 time.sleep(0.25)
             # dtimer.add('outer pos move')
             dtimer.add('trajectory armed')
@@ -532,81 +590,30 @@ class Slew_Scan(StepScan):
             # for det in self.detectors:
             #     det.stop()
 
-            self.write_master(["%s %8.4f" % (masterline, time.time()-start_time)])
+            row = {'irow': irow, 'npulses': npulses, 'masterline': masterline,
+                   'time': time.time()-start_time, 'scafile': scafile,
+                   'xrffile': xrffile, 'posfile': posfile,
+                   'dets_ok': dets_ok, 'debug': debug, 'dtimer': dtimer}
+            if self.row_saver is None:
+                self.write_master(["%s %8.4f" % (masterline, row['time'])])
 
-            if irow < npts-1:
+            if len(rows) > 0:
                 for p in self.positioners:
-                    p.move_to_pos(irow, wait=True)
+                    p.move_to_pos(rows[0]-1, wait=(self.row_saver is None))
 
             dtimer.add('start read')
 
-            pos_file = os.path.abspath(os.path.join(self.mapdir, posfile))
-            pos_saver_thread = Thread(target=self.xps.read_and_save,
-                                  args=(pos_file,), name='pos_saver')
-            pos_saver_thread.start()
-
-            npts_sca = npulses
-            nsca = -1
-            if scadet is not None:
-                scadet.stop()
-                sisfile = os.path.abspath(os.path.join(self.mapdir, scafile))
-                ncsa, npts_sca = scadet.save_arraydata(filename=sisfile, npts=npulses)
-            dtimer.add('saved SIS data')
-
-            nxrf = nxrd = 0
-            if xrfdet is not None:
-                xrfdet.stop()
-                t0 = time.time()
-                write_complete = xrfdet.file_write_complete()
-                ntry = 0
-                while not write_complete and (time.time()-t0 < 1.0):
-                    write_complete = xrfdet.file_write_complete()
-                    time.sleep(0.1)
-                    ntry = ntry + 1
-                nxrf = xrfdet.get_numcaptured()
-                if (nxrf < npulses-1) or not write_complete:
-                    time.sleep(0.50)
-                    xrfdet.finish_capture()
-                    nxrf = xrfdet.get_numcaptured()
-                    write_complete = xrfdet.file_write_complete()
-                if (nxrf < npulses-1) or not write_complete:
-                    time.sleep(0.50)
-                    xrfdet.finish_capture()
-                    nxrf = xrfdet.get_numcaptured()
-                    write_complete = xrfdet.file_write_complete()
-                if (nxrf < npulses-2) or not write_complete:
-                    print("XRF file write failed ", write_complete, nxrf,
-                          npulses, ntry)
-                    rowdata_ok = False
-                    xrfdet.stop()
-                    time.sleep(0.25)
-            dtimer.add('saved XRF data')
-
-            if xrddet is not None:
-                nxrd = xrddet.get_numcaptured()
-                while ((nxrd < nxrf) and
-                       (time.time()- t0 < 10.0)):
-                    nxrd = xrddet.get_numcaptured()
-                    time.sleep(0.01)
-                xrddet.stop()
-                dtimer.add('saved XRD data')
-
-            pos_saver_thread.join(timeout=30)
-            dtimer.add('saved XPS data')
-
-            rowdata_ok = (rowdata_ok and
-                          (npts_sca >= npulses-1) and
-                          (nxrf >= npulses-2) and
-                          (not pos_saver_thread.is_alive()))
-
-            if debug:
-                print("#== Row %d nXPS=%d, nSIS=%d, nXRF=%d, nXRD=%d  npulses=%d, OK=%s" %
-                      (irow, self.xps.ngathered, npts_sca, nxrf, nxrd, npulses, repr(rowdata_ok)))
-            if not rowdata_ok:
-                fmt=  '#BAD Row %d nXPS=%d, nSIS=%d, nXRF=%d, nXRD=%d: (npulses=%d) redo!\n'
-                self.write(fmt % (irow, self.xps.ngathered, npts_sca, nxrf, nxrd, npulses))
-                irow -= 1
-                [p.move_to_pos(irow, wait=False) for p in self.positioners]
+            pos_reader_thread = Thread(target=self.read_xps_gathering,
+                                       args=(row,), name='pos_reader')
+            pos_reader_thread.start()
+            row['pos_reader'] = pos_reader_thread
+
+            if self.row_saver is not None:
+                self.dets_released.clear()
+                self.row_saver.put(self.save_row, row)
+            elif not self.save_row(row):
+                rows.insert(0, irow)
+                [p.move_to_pos(irow-1, wait=False) for p in self.positioners]
                 time.sleep(0.25)
 
             # check again for pause, resume, and abort
@@ -623,14 +630,171 @@ class Slew_Scan(StepScan):
                 dtimer.show()
             time.sleep(0.025)
 
+        if self.row_saver is not None:
+            try:
+                self.row_saver.wait()
+            finally:
+                self.row_saver.stop()
+            if len(self.master_rows) > 0:
+                print("Rows not written to master file: %s" %
+                      ', '.join(['%i' % r for r in sorted(self.master_rows)]))
+
         if mappref is not None:
             caput('%sstatus' % (mappref), 'Finishing')
 
+        self.save_det_latency()
         self.post_scan()
         print('Scan done.')
-        self.set_info('scan_progress', 'done')
+        self.set_info('scan_progress', 'done', flush=True)
         return
 
+    def save_row(self, row):
+        """save and check data for a collected row.  Returns whether the
+        row data is OK.
+
+        First, the detectors are stopped, the Struck data is saved, and
+        the numbers of XRF and XRD frames captured are read.  With
+        pipelined rows, this runs in the row saver thread, and detectors
+        are then released for the next row (.dets_released).  Saving the
+        XPS data and waiting for the XRF file to be written is done after
+        that, overlapped with arming and starting the next row, and the
+        row is then finished with finish_row().
+        """
+        scadet, xrfdet, xrddet = self.rowdets
+        irow, npulses, dtimer = row['irow'], row['npulses'], row['dtimer']
+        rowdata_ok = row['dets_ok']
+        if not rowdata_ok:
+            print("Row %i: detectors were not ready" % irow)
+        npts_sca = npulses
+        nxrf = nxrd = 0
+        try:
+            if scadet is not None:
+                scadet.stop()
+                sisfile = os.path.abspath(os.path.join(self.mapdir, row['scafile']))
+                ncsa, npts_sca = scadet.save_arraydata(filename=sisfile, npts=npulses)
+            dtimer.add('saved SIS data')
+
+            if xrfdet is not None:
+                xrfdet.stop()
+                nxrf = xrfdet.get_numcaptured()
+                ntry = 0
+                while nxrf < npulses-1 and ntry < 2:
+                    time.sleep(0.50)
+                    xrfdet.finish_capture()
+                    nxrf = xrfdet.get_numcaptured()
+                    ntry = ntry + 1
+                dtimer.add('stopped XRF')
+
+            if xrddet is not None:
+                xrddet.stop()
+                nxrd = xrddet.get_numcaptured()
+                dtimer.add('stopped XRD')
+        finally:
+            if self.row_saver is not None:
+                self.dets_released.set()
+
+        pos_reader_thread = row['pos_reader']
+        pos_reader_thread.join(timeout=30)
+        nxps = self.save_xps_gathering(row)
+        dtimer.add('saved XPS data')
+
+        write_complete = True
+        if xrfdet is not None:
+            xrf_file = os.path.join(self.mapdir, row['xrffile'])
+            write_complete = self.wait_file_written(xrf_file)
+            if (nxrf < npulses-2) or not write_complete:
+                print("XRF file write failed ", write_complete, nxrf, npulses)
+            dtimer.add('saved XRF data')
+
+        rowdata_ok = (rowdata_ok and write_complete and
+                      (npts_sca >= npulses-1) and
+                      (nxrf >= npulses-2) and (nxps > 0))
+
+        if row['debug']:
+            print("#== Row %d nXPS=%d, nSIS=%d, nXRF=%d, nXRD=%d  npulses=%d, OK=%s" %
+                  (irow, nxps, npts_sca, nxrf, nxrd, npulses, repr(rowdata_ok)))
+        if not rowdata_ok:
+            fmt=  '#BAD Row %d nXPS=%d, nSIS=%d, nXRF=%d, nXRD=%d: (npulses=%d) redo!\n'
+            self.write(fmt % (irow, nxps, npts_sca, nxrf, nxrd, npulses))
+        if self.row_saver is not None:
+            self.finish_row(row, rowdata_ok)
+        return rowdata_ok
+
+    def read_xps_gathering(self, row):
+        """read XPS gathering data for a row, to be saved later by
+        save_xps_gathering().  This must be done before the next
+        trajectory is armed."""
+        npulses, buff = self.xps.read_gathering(set_idle_when_done=False)
+        row['xps_data'] = (npulses, self.xps.gather_titles, buff)
+
+    def save_xps_gathering(self, row):
+        """save XPS gathering data read for a row to its position file,
+        returning the number of points gathered"""
+        npulses, titles, buff = row.get('xps_data', (0, '', ''))
+        if npulses < 1:
+            return 0
+        pos_file = os.path.abspath(os.path.join(self.mapdir, row['posfile']))
+        with open(pos_file, 'w') as fh:
+            fh.write(titles)
+            fh.write(buff)
+        return npulses
+
+    def wait_file_written(self, filename, timeout=2.0, poll_time=0.1):
+        """wait for a detector data file to be written: to exist and
+        to have a size that is no longer changing, for at most timeout
+        seconds.  Returns whether the file was written."""
+        t0 = time.time()
+        size = -1
+        while True:
+            if os.path.exists(filename):
+                newsize = os.path.getsize(filename)
+                if newsize > 0 and newsize == size:
+                    return True
+                size = newsize
+            if time.time() - t0 > timeout:
+                return False
+            time.sleep(poll_time)
+
+    def finish_row(self, row, rowdata_ok):
+        """finish a pipelined row: failed rows are put on .rows_failed to
+        be collected again, and good rows are written to the master file
+        in row order, holding rows after a failed row until it is redone"""
+        if not rowdata_ok:
+            self.rows_failed.append(row['irow'])
+            return
+        self.master_rows[row['irow']] = "%s %8.4f" % (row['masterline'], row['time'])
+        lines = []
+        while self.next_master_row in self.master_rows:
+            lines.append(self.master_rows.pop(self.next_master_row))
+            self.next_master_row += 1
+        if len(lines) > 0:
+            self.write_master(lines)
+
+    def wait_row_detectors(self, timeout=60.0, poll_time=0.25):
+        """wait for the row saver to release detectors from the previous
+        row, checking for abort and raising any error from the row saver.
+
+        Returns False if the scan is aborted while waiting, and raises
+        a RuntimeError if detectors are not released within timeout."""
+        t0 = time.time()
+        while not self.dets_released.wait(poll_time):
+            if self.row_saver.error is not None:
+                break
+            if self.look_for_interrupts():
+                return False
+            if time.time() - t0 > timeout:
+                raise RuntimeError("detectors not released by row saver after %.1f sec" % timeout)
+        if self.row_saver.error is not None:
+            self.row_saver.wait()
+        return True
+
+    def save_det_latency(self):
+        """save detector arm and start times (in seconds) for each row
+        to scandb info 'slew_det_latency' (as JSON)"""
+        out = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'filename': self.filename, 'rows': self.det_latency}
+        self.scandb.set_info('slew_det_latency', json.dumps(out))
+
     def check_beam_ok(self):
         return True
 
@@ -156,6 +156,7 @@ class QXAFS_Scan(XAFS_Scan):
                            extra_pvs=extra_pvs, elem=elem, edge=edge, **kws)
         self.read_pv = None
         self.set_energy_pv(energy_pv, read_pv=None, extra_pvs=extra_pvs)
+        self.array_counters_per_point = False
         self.scantype = 'xafs'
         self.detmode  = 'roi'
         self.config = None
@@ -413,7 +414,7 @@ class QXAFS_Scan(XAFS_Scan):
         self.set_info('scan_total_points', npts)
 
         self.datafile.flush()
-        self.set_info('scan_progress', 'starting scan')
+        self.set_info('scan_progress', 'starting scan', flush=True)
         self.cpt = 0
         self.npts = npts
 
@@ -545,7 +546,8 @@ class QXAFS_Scan(XAFS_Scan):
         # self.check_outputs(out, msg='post scan')
         self.complete = True
         self.set_info('scan_progress',
-                      'scan complete. Wrote %s' % self.datafile.filename)
+                      'scan complete. Wrote %s' % self.datafile.filename,
+                      flush=True)
         self.scandb.set_info('qxafs_running', 0)
         self.runtime  = time.monotonic() - ts_start
         dtimer.add('done')
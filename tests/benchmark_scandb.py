@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of per-call latency for frequently called ScanDB methods
+
+Creates a temporary sqlite scan database, and times repeated calls of
+get_info, set_info, get_command_status, set_command_status and
+set_scandata, printing the mean and median time per call:
+
+   python benchmark_scandb.py --ncalls 2000
+"""
+import os
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+from epicsscan import ScanDB
+from epicsscan.scandb_schema import create_scandb
+
+def time_calls(func, ncalls):
+    "return array of times (in sec) for ncalls calls of func(i)"
+    times = np.zeros(ncalls)
+    for i in range(ncalls):
+        t0 = time.time()
+        func(i)
+        times[i] = time.time() - t0
+    return times
+
+def main():
+    parser = ArgumentParser(description='ScanDB per-call latency benchmark')
+    parser.add_argument('--ncalls', type=int, default=1000,
+                        help='number of calls per method [1000]')
+    parser.add_argument('--npts', type=int, default=500,
+                        help='number of points for set_scandata [500]')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='escan_bench_')
+    dbname = os.path.join(tmpdir, 'bench.db')
+    create_scandb(dbname, server='sqlite')
+    scandb = ScanDB(dbname=dbname, server='sqlite')
+    scandb.add_command('do_scan', arguments="'benchmark'")
+    scandb.commit()
+    cmdid = scandb.get_mostrecent_command().id
+    scandb.add_scandata_many([{'name': 'counter1', 'value': []}])
+    data = np.arange(args.npts, dtype=np.float64)
+
+    tests = (('get_info', lambda i: scandb.get_info('request_abort')),
+             ('set_info', lambda i: scandb.set_info('scan_current_point', i)),
+             ('get_command_status', lambda i: scandb.get_command_status(cmdid)),
+             ('set_command_status', lambda i: scandb.set_command_status('running', cmdid)),
+             ('set_scandata', lambda i: scandb.set_scandata('counter1', data)))
+
+    print("%-20s %12s %12s" % ('method', 'mean (us)', 'median (us)'))
+    try:
+        for name, func in tests:
+            func(0)
+            times = 1.e6*time_calls(func, args.ncalls)
+            print("%-20s %12.1f %12.1f" % (name, times.mean(), np.median(times)))
+    finally:
+        scandb.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of the scan engine, using simulated PVs
+
+Runs StepScan and XAFS_Scan against in-process simulated motors,
+counters and triggers (no Epics IOC or hardware needed), for a sweep
+of number of points, number of counters, and scan database, and
+reports per-point overhead, database statements per point, data file
+write time, memory use, and per-point phase times.
+
+Results are written to a JSON file, so that runs can be compared:
+
+   python benchmark_scans.py --npts 50,200 --ncounters 4,32 \
+          --db none,sqlite,sqlite_shm --output bench.json
+
+With --pipelined, each scan is also run with StepScan.pipelined set,
+and --readtime sets a simulated read time per counter.
+
+Database options are 'none' (no scan database), 'sqlite' (sqlite file
+in a temporary directory) and 'sqlite_shm' (sqlite file in /dev/shm,
+for a database held in memory).
+
+Slew_Scan is not included: it needs a Newport XPS trajectory
+controller and mapping detectors, which are not simulated here.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import platform
+from threading import Timer
+from itertools import product
+from argparse import ArgumentParser
+
+import numpy as np
+from epics import PV
+from sqlalchemy.orm import clear_mappers
+
+import epicsscan
+from epicsscan import StepScan, XAFS_Scan, Positioner, ScanDB
+from epicsscan.scandb_schema import create_scandb
+from epicsscan.detectors import trigger as trigger_mod
+from epicsscan.detectors import counter as counter_mod
+
+class SimPV(PV):
+    """in-process simulated PV
+
+    put() sets the value and runs any callback after .delay seconds,
+    as for a motor move or detector count.  If .noise is set, get()
+    returns the value plus random noise.
+    """
+    # plain attributes in place of the PV properties that read CA state
+    units = ''
+    precision = None
+    upper_ctrl_limit = None
+    lower_ctrl_limit = None
+    put_complete = True
+
+    def __init__(self, pvname, value=0.0, delay=0.0, noise=0.0, units=''):
+        self.pvname = pvname
+        self.chid = pvname
+        self._simval = value
+        self.delay = delay
+        self.noise = noise
+        self.units = units
+        self.connected = True
+
+    def __repr__(self):
+        return "<SimPV '%s'>" % self.pvname
+
+    @property
+    def value(self):
+        return self.get()
+
+    def connect(self, timeout=None):
+        return True
+
+    def wait_for_connection(self, timeout=None):
+        return True
+
+    def get_ctrlvars(self, **kws):
+        return {}
+
+    def get(self, **kws):
+        if self.noise > 0:
+            return self._simval + self.noise*np.random.random()
+        return self._simval
+
+    def put(self, value, wait=False, timeout=None, callback=None, **kws):
+        self._simval = value
+        if callback is not None:
+            if self.delay > 0 and not wait:
+                Timer(self.delay, callback, kwargs={'pvname': self.pvname}).start()
+            else:
+                callback(pvname=self.pvname)
+        elif wait and self.delay > 0:
+            time.sleep(self.delay)
+
+class SimCA(object):
+    """simulated epics.ca layer for CounterGroup"""
+    def __init__(self, read_delay=0.0):
+        self.pvs = {}
+        self.read_delay = read_delay
+
+    def get_pv(self, pvname, **kws):
+        if pvname not in self.pvs:
+            self.pvs[pvname] = SimPV(pvname, value=1.0, noise=100.0)
+        return self.pvs[pvname]
+
+    def get(self, chid, wait=True, **kws):
+        return self.pvs[chid].get() if wait else None
+
+    def flush_io(self):
+        pass
+
+    def get_complete(self, chid, **kws):
+        if self.read_delay > 0:
+            time.sleep(self.read_delay)
+        return self.pvs[chid].get()
+
+class SimulatedPVs(object):
+    """context manager replacing PV creation in the scan modules
+    with simulated PVs"""
+    def __init__(self, trigger_delay=0.01):
+        self.ca = SimCA()
+        self.trigger_delay = trigger_delay
+        self.saved = {}
+
+    def _get_pv(self, pvname, **kws):
+        pv = self.ca.get_pv(pvname)
+        if pvname.startswith('Sim:trig'):
+            pv.delay, pv.noise = self.trigger_delay, 0
+        return pv
+
+    def __enter__(self):
+        for mod in (trigger_mod, counter_mod):
+            self.saved[mod] = (mod.get_pv, getattr(mod, 'ca', None))
+            mod.get_pv = self._get_pv
+        counter_mod.ca = self.ca
+        return self
+
+    def __exit__(self, *args):
+        for mod, (get_pv, ca) in self.saved.items():
+            mod.get_pv = get_pv
+            if ca is not None:
+                mod.ca = ca
+
+class StatementCounter(object):
+    "count SQL statements executed by a ScanDB"
+    def __init__(self, scandb=None):
+        self.count = 0
+        if scandb is not None:
+            from sqlalchemy import event
+            event.listen(scandb.engine, 'before_cursor_execute', self.add)
+
+    def add(self, *args, **kws):
+        self.count += 1
+
+def make_scandb(db, tmpdir):
+    "create scan database: db is 'none', 'sqlite', or 'sqlite_shm'"
+    if db == 'none':
+        return None
+    dirname = tmpdir
+    if db == 'sqlite_shm':
+        dirname = tempfile.mkdtemp(prefix='escan_bench_', dir='/dev/shm')
+    dbname = os.path.join(dirname, 'bench_%d.db' % int(1.e6*time.time()))
+    create_scandb(dbname, server='sqlite')
+    scandb = ScanDB(dbname=dbname, server='sqlite')
+    scandb.set_info('user_folder', tmpdir)
+    # scans update the current command, as when run from the ScanServer
+    scandb.add_command('do_scan', arguments="'benchmark'")
+    scandb.commit()
+    return scandb
+
+def build_scan(scantype, npts, ncounters, dwelltime, scandb, tmpdir,
+               pipelined=False):
+    "build a simulated scan"
+    fname = os.path.join(tmpdir, '%s.dat' % scantype)
+    if scantype == 'xafs':
+        energy = SimPV('Sim:energy', value=7000.0, delay=0.002, units='eV')
+        scan = XAFS_Scan(energy_pv=energy, read_pv='Sim:energy_rbv',
+                         e0=7112.0, elem='Fe', edge='K', scandb=scandb,
+                         filename=fname)
+        nk = max(4, npts - 40)
+        scan.add_region(-50, -10, npts=10, dtime=dwelltime)
+        scan.add_region(-10, 20, npts=31, dtime=dwelltime)
+        scan.add_region(3, 12, npts=nk, use_k=True, dtime=dwelltime,
+                        dtime_final=2*dwelltime, dtime_wt=1)
+    else:
+        scan = StepScan(filename=fname, scandb=scandb)
+        pos = Positioner(SimPV('Sim:m1', delay=0.002, units='mm'), label='x')
+        pos.array = np.linspace(0, 1, npts)
+        scan.add_positioner(pos)
+        scan.set_dwelltime(dwelltime)
+    scan.messenger = lambda msg: None
+    scan.add_trigger('Sim:trig1', label='trigger')
+    for i in range(ncounters):
+        scan.add_counter('Sim:counter%d' % (i+1), label='counter%d' % (i+1))
+    scan.profile = True
+    scan.pipelined = pipelined
+    return scan
+
+def run_one(scantype, npts, ncounters, db, dwelltime, sim, pipelined=False):
+    "run one benchmark, returning dictionary of results"
+    tmpdir = tempfile.mkdtemp(prefix='escan_bench_')
+    scandb = make_scandb(db, tmpdir)
+    sim.trigger_delay = dwelltime
+    try:
+        scan = build_scan(scantype, npts, ncounters, dwelltime, scandb, tmpdir,
+                          pipelined=pipelined)
+        stmts = StatementCounter(scandb)
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.time()
+        scan.run()
+        runtime = time.time() - t0
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        npts = scan.npts
+        counttime = npts*dwelltime
+        if scan.dwelltime_varys:
+            counttime = float(np.sum(scan.dwelltime))
+        filetime = None
+        dtimes = dict(scan.dtimer.times)
+        if 'Post: file written' in dtimes:
+            filetime = (dtimes['Post: file written'] -
+                        dtimes['Post: return move issued'])
+        result = {'scantype': scantype, 'npts': npts, 'ncounters': ncounters,
+                  'db': db, 'dwelltime': dwelltime, 'pipelined': pipelined,
+                  'read_delay': sim.ca.read_delay,
+                  'runtime': runtime, 'looptime': scan.looptime,
+                  'inittime': scan.inittime, 'exittime': scan.exittime,
+                  'overhead_per_point': (scan.looptime - counttime)/npts,
+                  'db_statements': stmts.count,
+                  'db_statements_per_point': stmts.count/float(npts),
+                  'file_write_time': filetime,
+                  'maxrss_kb': rss1, 'maxrss_increase_kb': rss1 - rss0,
+                  'publish': scan.publish_stats,
+                  'phases': scan.phase_timer.get_summary()}
+    finally:
+        if scandb is not None:
+            scandb.close()
+            clear_mappers()
+            dbdir = os.path.dirname(scandb.dbname)
+            if dbdir != tmpdir:
+                shutil.rmtree(dbdir, ignore_errors=True)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return result
+
+def main():
+    parser = ArgumentParser(description='offline scan engine benchmark')
+    parser.add_argument('--scans', default='step,xafs',
+                        help='scan types: step,xafs [step,xafs]')
+    parser.add_argument('--npts', default='50,200',
+                        help='numbers of points [50,200]')
+    parser.add_argument('--ncounters', default='4,32',
+                        help='numbers of counters [4,32]')
+    parser.add_argument('--db', default='none,sqlite,sqlite_shm',
+                        help='databases: none,sqlite,sqlite_shm [all]')
+    parser.add_argument('--dwelltime', type=float, default=0.01,
+                        help='simulated count time per point [0.01]')
+    parser.add_argument('--readtime', type=float, default=0.0,
+                        help='simulated read time per counter [0]')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='also run scans in pipelined mode')
+    parser.add_argument('--output', default='scan_benchmark.json',
+                        help='output JSON file [scan_benchmark.json]')
+    args = parser.parse_args()
+
+    dbs = args.db.split(',')
+    if 'sqlite_shm' in dbs and not os.path.isdir('/dev/shm'):
+        dbs.remove('sqlite_shm')
+
+    results = []
+    fmt = "%-5s npts=%5d ncounters=%3d db=%-10s pipelined=%-5s overhead/pt=%8.5f s  db/pt=%6.1f  file=%s s"
+    modes = [False, True] if args.pipelined else [False]
+    with SimulatedPVs() as sim:
+        sim.ca.read_delay = args.readtime
+        for scantype in args.scans.split(','):
+            for npts in [int(n) for n in args.npts.split(',')]:
+                for ncounters in [int(n) for n in args.ncounters.split(',')]:
+                    for db, pipelined in product(dbs, modes):
+                        res = run_one(scantype, npts, ncounters, db,
+                                      args.dwelltime, sim, pipelined=pipelined)
+                        results.append(res)
+                        ftime = res['file_write_time']
+                        print(fmt % (scantype, res['npts'], ncounters, db,
+                                     pipelined, res['overhead_per_point'],
+                                     res['db_statements_per_point'],
+                                     'None' if ftime is None else '%.4f' % ftime))
+
+    out = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+           'python': sys.version.split()[0],
+           'platform': platform.platform(),
+           'numpy': np.__version__,
+           'epicsscan': epicsscan.__version__,
+           'results': results}
+    with open(args.output, 'w') as fh:
+        json.dump(out, fh, indent=1)
+    print("wrote %s" % args.output)
+
+if __name__ == '__main__':
+    main()
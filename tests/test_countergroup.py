@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Test of CounterGroup, using a mock epics.ca layer (no Epics IOC needed)
+
+   python -m pytest test_countergroup.py
+or
+   python test_countergroup.py
+"""
+import unittest
+import numpy as np
+
+from epicsscan.detectors import counter as counter_mod
+from epicsscan.detectors.counter import Counter, ROISumCounter, CounterGroup
+
+class MockPV(object):
+    "mock PV, with pvname as chid"
+    def __init__(self, pvname, value=0.0, connected=True):
+        self.pvname = pvname
+        self.chid = pvname
+        self.value = value
+        self.connected = connected
+
+    def get(self, **kws):
+        return self.value
+
+class MockCA(object):
+    """mock epics.ca layer, recording the calls made:
+    get() with wait=False only starts a request, which
+    get_complete() must then finish"""
+    def __init__(self):
+        self.pvs = {}
+        self.calls = []
+        self.requested = set()
+
+    def get_pv(self, pvname, **kws):
+        if pvname not in self.pvs:
+            self.pvs[pvname] = MockPV(pvname)
+        return self.pvs[pvname]
+
+    def get(self, chid, wait=True, **kws):
+        self.calls.append(('get', chid, wait))
+        if wait:
+            return self.pvs[chid].value
+        self.requested.add(chid)
+        return None
+
+    def flush_io(self):
+        self.calls.append(('flush_io',))
+
+    def get_complete(self, chid, timeout=None, **kws):
+        self.calls.append(('get_complete', chid, timeout))
+        if chid not in self.requested:
+            raise RuntimeError("get_complete without get for %s" % chid)
+        self.requested.discard(chid)
+        return self.pvs[chid].value
+
+class CounterGroupTest(unittest.TestCase):
+    def setUp(self):
+        self.ca = MockCA()
+        self.saved = (counter_mod.get_pv, counter_mod.poll)
+        counter_mod.get_pv = self.ca.get_pv
+        counter_mod.poll = lambda *args, **kws: None
+
+    def tearDown(self):
+        counter_mod.get_pv, counter_mod.poll = self.saved
+
+    def set_values(self, **vals):
+        for pvname, val in vals.items():
+            self.ca.get_pv(pvname).value = val
+
+    def test_values(self):
+        self.set_values(A=1.5, B=2.5)
+        ca, cb = Counter('A', label='a'), Counter('B', label='b')
+        grp = CounterGroup([ca, cb], timeout=3.0, ca_module=self.ca)
+        grp.read()
+        self.set_values(A=3.5, B=4.5)
+        data = grp.read()
+        self.assertEqual(data, {'A': 3.5, 'B': 4.5})
+        self.assertEqual(ca.buff, [1.5, 3.5])
+        self.assertEqual(cb.buff, [2.5, 4.5])
+
+    def test_get_complete(self):
+        counters = [Counter(name) for name in ('A', 'B', 'C')]
+        grp = CounterGroup(counters, timeout=3.0, ca_module=self.ca)
+        grp.read()
+        # all requests are sent, then flushed once, then completed
+        self.assertEqual(self.ca.calls,
+                         [('get', 'A', False), ('get', 'B', False),
+                          ('get', 'C', False), ('flush_io',),
+                          ('get_complete', 'A', 3.0),
+                          ('get_complete', 'B', 3.0),
+                          ('get_complete', 'C', 3.0)])
+        self.assertEqual(self.ca.requested, set())
+
+    def test_disconnected(self):
+        self.set_values(A=1.0, B=2.0)
+        self.ca.get_pv('B').connected = False
+        ca, cb = Counter('A'), Counter('B')
+        grp = CounterGroup([ca, cb], ca_module=self.ca)
+        data = grp.read()
+        self.assertEqual(data, {'A': 1.0, 'B': None})
+        self.assertEqual(ca.buff, [1.0])
+        self.assertEqual(cb.buff, [None])
+        self.assertNotIn(('get', 'B', False), self.ca.calls)
+        self.assertNotIn('B', [c[1] for c in self.ca.calls
+                               if c[0] == 'get_complete'])
+
+    def test_array_and_roisum(self):
+        self.set_values(MCA=np.arange(4.0), ROI1=10.0, ROI2=20.0,
+                        DTC1=1.0, DTC2=2.0)
+        mca = Counter('MCA')
+        roi = ROISumCounter('roi', 'ROI%i', 'DTC%i', 2)
+        grp = CounterGroup([mca, roi], ca_module=self.ca)
+        grp.read()
+        self.assertEqual(mca.buff, [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(roi.buff, [50.0])
+        self.assertEqual(len([c for c in self.ca.calls
+                              if c[0] == 'get_complete']), 5)
+
+if __name__ == '__main__':
+    unittest.main()